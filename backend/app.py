@@ -1,18 +1,204 @@
 # ==========================================================
 # app.py — Backend FastAPI para predicción de líneas y genes
 # ==========================================================
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse, Response, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel, Field
 from typing import Optional
-import joblib, torch, json
+import joblib, json, os, threading, io, csv, itertools, time, hashlib, gc, bisect, contextvars, math
+import cProfile, pstats, hmac, functools, uuid, asyncio, heapq, random, queue, logging, logging.handlers, atexit
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import OrderedDict
 import numpy as np
 import pandas as pd
 from pathlib import Path
 import unicodedata
+import re
+from email.utils import formatdate, parsedate_to_datetime
 
 app = FastAPI(title="AbioStress Backend", version="1.0")
 
+def _crop_env_map(name: str) -> dict[str, str]:
+    """Lee una variable tipo "tomate=numpy,maiz=torchscript" como {prefix: valor}"""
+    return dict(
+        (k.strip(), v.strip())
+        for k, v in (item.split("=", 1) for item in os.environ.get(name, "").split(",") if "=" in item)
+    )
+
+# --- Control de admisión: concurrencia, colas y plazos por endpoint ---
+# Los handlers son def síncronos que comparten el threadpool de AnyIO (40 hilos). Cada
+# endpoint de ADMISSION_LIMITS admite hasta `concurrency` peticiones a la vez y las demás
+# esperan en una cola de hasta `queue` lugares. Si la cola está llena, o la petición no
+# entra antes de `deadline_ms` desde que llegó, se responde 503 con Retry-After en lugar de
+# dejar crecer la latencia. Además, ADMISSION_MAX_INFLIGHT limita el total de peticiones en
+# curso, y en esa cola global pasan primero los endpoints de ADMISSION_PRIORITY.
+ADMISSION_ENABLED = os.environ.get("ABIO_ADMISSION", "1") == "1"
+ADMISSION_DEFAULTS = {
+    # concurrency, queue, deadline_ms (0 = sin límite / sin plazo)
+    "/predict": (32, 256, 2000),
+    "/predict/batch": (8, 32, 10000),
+    "/predict/best": (8, 64, 5000),
+    "/predict/sweep": (4, 16, 10000),
+    "/predict/upload": (2, 4, 0),
+    "/interpretation/rows": (4, 32, 10000),
+}
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("ABIO_ADMISSION_MAX_INFLIGHT", "40"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ABIO_ADMISSION_MAX_QUEUE", "512"))
+ADMISSION_PRIORITY = [p.strip() for p in os.environ.get("ABIO_ADMISSION_PRIORITY", "/predict").split(",") if p.strip()]
+ADMISSION_RETRY_AFTER_S = int(os.environ.get("ABIO_ADMISSION_RETRY_AFTER_S", "1"))
+ADMISSION_OUTCOMES = ("admitted", "queued", "rejected", "timed_out", "deadline_exceeded")
+
+def _admission_limits() -> dict[str, dict]:
+    """ADMISSION_DEFAULTS con los cambios de ABIO_ADMISSION_LIMITS ("/predict=64:512:2000,...")"""
+    limits = {path: dict(zip(("concurrency", "queue", "deadline_ms"), spec)) for path, spec in ADMISSION_DEFAULTS.items()}
+    for path, spec in _crop_env_map("ABIO_ADMISSION_LIMITS").items():
+        values = [int(v) for v in spec.split(":")]
+        current = limits.get(path, {"concurrency": 0, "queue": 0, "deadline_ms": 0})
+        limits[path] = {**current, **dict(zip(("concurrency", "queue", "deadline_ms"), values))}
+    return limits
+
+class _AdmissionRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+class _AdmissionGate:
+    """Semáforo del event loop con cola acotada (max_queue=0: sin límite); menor prioridad = entra antes"""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self.queued = 0
+        self._waiters: list = []  # heap de (prioridad, orden de llegada, future)
+        self._seq = itertools.count()
+        self._counts_lock = threading.Lock()
+        self.counts = {outcome: 0 for outcome in ADMISSION_OUTCOMES}
+
+    def count(self, outcome: str):
+        with self._counts_lock:
+            self.counts[outcome] += 1
+
+    async def acquire(self, priority: int, timeout: Optional[float]) -> bool:
+        """Toma un lugar; devuelve True si tuvo que esperar. Lanza _AdmissionRejected"""
+        if self.active < self.limit and self.queued == 0:
+            self.active += 1
+            return False
+        if self.max_queue > 0 and self.queued >= self.max_queue:
+            raise _AdmissionRejected("rejected")
+        if timeout is not None and timeout <= 0:
+            raise _AdmissionRejected("timed_out")
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self.queued += 1
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                self.release()  # el lugar llegó justo cuando se cancelaba la espera
+            else:
+                fut.cancel()
+                self.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise _AdmissionRejected("timed_out")
+            raise
+        return True
+
+    def release(self):
+        # El lugar pasa directamente al siguiente de la cola (las esperas canceladas se saltan)
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.queued -= 1
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        with self._counts_lock:
+            counts = dict(self.counts)
+        return {"limit": self.limit, "max_queue": self.max_queue, "in_flight": self.active, "queue_depth": self.queued, **counts}
+
+ADMISSION_LIMITS = _admission_limits()
+_ADMISSION_GATES = {
+    path: _AdmissionGate(lim["concurrency"], lim["queue"])
+    for path, lim in ADMISSION_LIMITS.items() if lim["concurrency"] > 0
+}
+_ADMISSION_GLOBAL = _AdmissionGate(ADMISSION_MAX_INFLIGHT, ADMISSION_MAX_QUEUE) if ADMISSION_MAX_INFLIGHT > 0 else None
+# Plazo (time.monotonic) y endpoint de la petición en curso, para _check_deadline
+_REQUEST_DEADLINE: contextvars.ContextVar[Optional[tuple]] = contextvars.ContextVar("abio_request_deadline", default=None)
+
+def _overloaded_response(detail: str) -> JSONResponse:
+    return JSONResponse({"detail": detail}, status_code=503, headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)})
+
+def _check_deadline(stage: str):
+    """Corta con 503 si la petición ya superó su plazo (llamar antes de etapas caras)"""
+    current = _REQUEST_DEADLINE.get()
+    if current is None or current[0] is None or time.monotonic() <= current[0]:
+        return
+    gate = _ADMISSION_GATES.get(current[1])
+    if gate is not None:
+        gate.count("deadline_exceeded")
+    raise HTTPException(
+        status_code=503,
+        detail=f"Plazo de la petición agotado antes de {stage}; reintentar más tarde",
+        headers={"Retry-After": str(ADMISSION_RETRY_AFTER_S)},
+    )
+
+class _AdmissionMiddleware:
+    """Middleware ASGI: aplica ADMISSION_LIMITS por ruta antes de ocupar un hilo del threadpool"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path")
+        limits = ADMISSION_LIMITS.get(path) if scope["type"] == "http" else None
+        if limits is None:
+            return await self.app(scope, receive, send)
+
+        deadline = time.monotonic() + limits["deadline_ms"] / 1000 if limits["deadline_ms"] > 0 else None
+        priority = 0 if path in ADMISSION_PRIORITY else 1
+        endpoint_gate = _ADMISSION_GATES.get(path)
+        acquired, waits = [], []
+        for gate in (endpoint_gate, _ADMISSION_GLOBAL):
+            if gate is None:
+                continue
+            timeout = None if deadline is None else deadline - time.monotonic()
+            try:
+                waited = await gate.acquire(priority, timeout)
+            except _AdmissionRejected as e:
+                for g in acquired:
+                    g.release()
+                # Cuenta la puerta que decidió y también el endpoint, cuyo resultado final es este
+                gate.count(e.reason)
+                if endpoint_gate is not None and gate is not endpoint_gate:
+                    endpoint_gate.count(e.reason)
+                motivo = "cola llena" if e.reason == "rejected" else "plazo de espera agotado"
+                return await _overloaded_response(f"Servidor ocupado ({path}: {motivo}); reintentar más tarde")(scope, receive, send)
+            acquired.append(gate)
+            waits.append(waited)
+
+        # Con todas las puertas resueltas: el endpoint cuenta "queued" si esperó en cualquiera
+        for gate, waited in zip(acquired, waits):
+            if gate is endpoint_gate:
+                waited = any(waits)
+            gate.count("queued" if waited else "admitted")
+
+        token = _REQUEST_DEADLINE.set((deadline, path))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _REQUEST_DEADLINE.reset(token)
+            for g in reversed(acquired):
+                g.release()
+
+if ADMISSION_ENABLED:
+    # Primero en registrarse = el más interno: CORS, métricas y perfilado también ven los 503
+    app.add_middleware(_AdmissionMiddleware)
+
 # --- CORS: permitir llamadas desde el frontend en dev ---
 app.add_middleware(
     CORSMiddleware,
@@ -26,6 +212,394 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Métricas en formato Prometheus (GET /metrics) ---
+# Implementación mínima sin dependencias: histogramas y contadores con un lock cada uno.
+# Con serve.py cada worker lleva sus propias métricas.
+METRICS_ENABLED = os.environ.get("ABIO_METRICS", "1") == "1"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _prom_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = []
+    for k, v in zip(labelnames, values):
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: tuple, buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames, self.buckets = name, help_text, labelnames, buckets
+        self._lock = threading.Lock()
+        self._series: dict[tuple, list] = {}  # labels → [conteos por bucket..., suma, total]
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in sorted(items):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_prom_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_prom_labels(self.labelnames, labels)} {series[-2]}")
+            lines.append(f"{self.name}_count{_prom_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, labelnames: tuple):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_prom_labels(self.labelnames, labels)} {value}" for labels, value in items]
+        return lines
+
+def _prom_gauge(name: str, help_text: str, labelnames: tuple, samples: list[tuple], kind: str = "gauge") -> list[str]:
+    """Valores calculados al momento de servir /metrics: samples = [(labels, valor), ...]"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    lines += [f"{name}{_prom_labels(labelnames, labels)} {value}" for labels, value in samples if value is not None]
+    return lines
+
+REQUEST_LATENCY = _Histogram("abio_request_seconds", "Latencia de peticiones HTTP", ("endpoint", "cultivo"))
+REQUESTS_TOTAL = _Counter("abio_requests_total", "Peticiones HTTP por endpoint y código", ("endpoint", "status"))
+STAGE_LATENCY = _Histogram("abio_stage_seconds", "Duración de cada etapa interna", ("stage", "cultivo"))
+CROP_LOAD_LATENCY = _Histogram(
+    "abio_crop_load_seconds", "Tiempo de carga de un cultivo", ("cultivo", "source"),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# Datos de la petición en curso que los handlers completan (p. ej. el cultivo)
+_REQUEST_INFO: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("abio_request_info", default=None)
+
+def _stage_done(stage: str, cultivo: str, t0: float) -> float:
+    """Registra la etapa que empezó en t0 y devuelve el instante actual (inicio de la siguiente)"""
+    now = time.perf_counter()
+    if METRICS_ENABLED:
+        STAGE_LATENCY.observe(now - t0, stage, cultivo)
+    return now
+
+def _set_request_cultivo(cultivo: str):
+    info = _REQUEST_INFO.get()
+    if info is not None:
+        info["cultivo"] = cultivo
+
+class _MetricsMiddleware:
+    """Middleware ASGI: latencia y código de respuesta por endpoint (ruta, no URL) y cultivo"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        t0 = time.perf_counter()
+        status = [500]
+        info: dict = {}
+        token = _REQUEST_INFO.set(info)
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _REQUEST_INFO.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "otro"
+            REQUEST_LATENCY.observe(time.perf_counter() - t0, endpoint, info.get("cultivo", ""))
+            REQUESTS_TOTAL.inc(endpoint, str(status[0]))
+
+if METRICS_ENABLED:
+    app.add_middleware(_MetricsMiddleware)
+
+# --- Respuestas JSON: encoder rápido, compresión y validadores HTTP (ETag / Last-Modified) ---
+try:
+    import orjson
+except ImportError:  # opcional: sin orjson se usa json de la librería estándar
+    orjson = None
+
+GZIP_MIN_BYTES = int(os.environ.get("ABIO_GZIP_MIN_BYTES", "1024"))
+if GZIP_MIN_BYTES > 0:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=6)
+
+def _json_bytes(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _etag(*parts) -> str:
+    return 'W/"' + hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20] + '"'
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[float]) -> bool:
+    """True si el cliente ya tiene esta versión (If-None-Match tiene prioridad sobre If-Modified-Since)"""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or etag[2:] in tags
+    ims = request.headers.get("if-modified-since")
+    if ims and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _validator_headers(etag: str, last_modified: Optional[float]) -> dict:
+    # no-cache: el navegador guarda la respuesta pero la revalida siempre (barato con 304)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    return headers
+
+def _cached_json_response(request: Request, build, etag: str, last_modified: Optional[float]) -> Response:
+    """304 si el cliente ya tiene la versión `etag`; si no, build() serializado con el encoder rápido"""
+    headers = _validator_headers(etag, last_modified)
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+    body = build()
+    if not isinstance(body, bytes):
+        body = _json_bytes(body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# --- Perfilado bajo demanda de una petición (solo administradores) ---
+# Con ABIO_ADMIN_TOKEN definido, una petición con los headers
+#   X-Admin-Token: <token>
+#   X-Abio-Profile: cprofile | torch
+# corre su handler bajo cProfile (y torch.profiler con "torch") en el mismo hilo del
+# handler. El perfil se guarda en ABIO_PROFILE_DIR, que conserva solo los ABIO_PROFILE_RING
+# más recientes, y su id vuelve en el header X-Abio-Profile-Id. GET /admin/profiles los
+# lista y GET /admin/profiles/{id} los descarga.
+ADMIN_TOKEN = os.environ.get("ABIO_ADMIN_TOKEN", "")
+PROFILE_DIR = Path(os.environ.get("ABIO_PROFILE_DIR", Path(__file__).resolve().parent / "logs" / "profiles"))
+PROFILE_RING = int(os.environ.get("ABIO_PROFILE_RING", "50"))
+PROFILE_MODES = ("cprofile", "torch")
+PROFILE_TOP_FUNCTIONS = 40
+PROFILE_FORMATS = {"prof": ".prof", "txt": ".txt", "torch": ".trace.json"}
+_PROFILE_LOCK = threading.Lock()
+_PROFILE_REQUEST: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("abio_profile_request", default=None)
+
+def _is_admin(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN) and token is not None and hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Perfilado desactivado (definir ABIO_ADMIN_TOKEN)")
+    if not _is_admin(request.headers.get("x-admin-token")):
+        raise HTTPException(status_code=403, detail="Token de administración inválido")
+
+class _ProfileMiddleware:
+    """Middleware ASGI: marca la petición para perfilar y agrega X-Abio-Profile-Id a la respuesta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        mode = headers.get(b"x-abio-profile")
+        if mode is None:
+            return await self.app(scope, receive, send)
+
+        mode = mode.decode("latin-1").strip().lower() or "cprofile"
+        error = None
+        if not ADMIN_TOKEN:
+            error = (404, "Perfilado desactivado (definir ABIO_ADMIN_TOKEN)")
+        elif not _is_admin(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            error = (403, "Token de administración inválido")
+        elif mode not in PROFILE_MODES:
+            error = (400, f"X-Abio-Profile no válido: {mode}. Opciones: {list(PROFILE_MODES)}")
+        if error is not None:
+            return await JSONResponse({"detail": error[1]}, status_code=error[0])(scope, receive, send)
+
+        profile = {"mode": mode, "path": scope["path"], "query": scope.get("query_string", b"").decode("latin-1"), "id": None}
+        token = _PROFILE_REQUEST.set(profile)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start" and profile["id"]:
+                message["headers"] = list(message.get("headers", [])) + [(b"x-abio-profile-id", profile["id"].encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _PROFILE_REQUEST.reset(token)
+
+app.add_middleware(_ProfileMiddleware)
+
+def _save_profile(profile: dict, handler_name: str, prof: cProfile.Profile, torch_prof, elapsed: float, error: Optional[str]):
+    """Escribe el perfil (.prof, resumen .txt, traza de torch) y recorta el anillo"""
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    base = PROFILE_DIR / profile["id"]
+    prof.dump_stats(str(base) + ".prof")
+    summary = io.StringIO()
+    pstats.Stats(prof, stream=summary).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+    Path(str(base) + ".txt").write_text(summary.getvalue(), encoding="utf-8")
+    formats = ["prof", "txt"]
+    if torch_prof is not None:
+        torch_prof.export_chrome_trace(str(base) + ".trace.json")
+        formats.append("torch")
+    meta = {
+        "id": profile["id"],
+        "handler": handler_name,
+        "path": profile["path"],
+        "query": profile["query"],
+        "mode": profile["mode"] if torch_prof is not None else "cprofile",
+        "duration_ms": elapsed * 1e3,
+        "created": time.time(),
+        "pid": os.getpid(),
+        "error": error,
+        "formats": formats,
+    }
+    # El .meta.json se escribe al final: un perfil aparece en la lista solo cuando está completo
+    Path(str(base) + ".meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    with _PROFILE_LOCK:
+        metas = sorted(PROFILE_DIR.glob("*.meta.json"))
+        for old in metas[:max(0, len(metas) - PROFILE_RING)]:
+            old_id = old.name[:-len(".meta.json")]
+            for f in PROFILE_DIR.glob(f"{old_id}.*"):
+                f.unlink(missing_ok=True)
+
+def _profiled(handler):
+    """Decorador para handlers síncronos: si la petición pidió perfilado, lo corre bajo cProfile"""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        profile = _PROFILE_REQUEST.get()
+        if profile is None or profile["id"] is not None:
+            return handler(*args, **kwargs)
+
+        # El id empieza con la fecha (hasta ms) para que el orden por nombre sea el cronológico
+        now = time.time()
+        profile_id = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now * 1000) % 1000:03d}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        prof = cProfile.Profile()
+        torch_prof = None
+        if profile["mode"] == "torch" and torch is not None:
+            torch_prof = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], record_shapes=True)
+            torch_prof.__enter__()
+        error = None
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            return handler(*args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            prof.disable()
+            elapsed = time.perf_counter() - t0
+            if torch_prof is not None:
+                torch_prof.__exit__(None, None, None)
+            profile["id"] = profile_id
+            try:
+                _save_profile(profile, handler.__name__, prof, torch_prof, elapsed, error)
+            except Exception as e:
+                profile["id"] = None
+                print(f"⚠️ No se pudo guardar el perfil {profile_id}: {e}")
+    return wrapper
+
+# --- Captura muestreada de tráfico (para replay.py) ---
+# Con ABIO_CAPTURE_RATE > 0, esa fracción de las peticiones a CAPTURE_PATHS se agrega como una
+# línea JSON (ruta, query, cuerpo, código y duración) a ABIO_CAPTURE_DIR/capture_<pid>.ndjson,
+# que rota al llegar a ABIO_CAPTURE_MAX_MB. Escribe un hilo aparte (QueueListener de logging):
+# la petición solo paga el sorteo, copiar el cuerpo y encolar la línea.
+CAPTURE_RATE = float(os.environ.get("ABIO_CAPTURE_RATE", "0"))
+CAPTURE_DIR = Path(os.environ.get("ABIO_CAPTURE_DIR", Path(__file__).resolve().parent / "logs" / "capture"))
+CAPTURE_MAX_BYTES = int(float(os.environ.get("ABIO_CAPTURE_MAX_MB", "50")) * 1024 * 1024)
+CAPTURE_BACKUPS = int(os.environ.get("ABIO_CAPTURE_BACKUPS", "5"))
+CAPTURE_PATHS = ("/predict", "/interpretation/rows")
+CAPTURE_MAX_BODY = 64 * 1024
+_CAPTURE: dict = {"pid": None, "queue": None}
+_CAPTURE_LOCK = threading.Lock()
+
+def _capture_queue() -> queue.SimpleQueue:
+    """Cola del escritor de este proceso (se crea en el primer uso; con serve.py, una por worker)"""
+    with _CAPTURE_LOCK:
+        if _CAPTURE["pid"] != os.getpid():
+            CAPTURE_DIR.mkdir(parents=True, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                CAPTURE_DIR / f"capture_{os.getpid()}.ndjson",
+                maxBytes=CAPTURE_MAX_BYTES, backupCount=CAPTURE_BACKUPS, encoding="utf-8",
+            )
+            q: queue.SimpleQueue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(q, handler)
+            listener.start()
+            atexit.register(listener.stop)  # vacía la cola al salir
+            _CAPTURE.update(pid=os.getpid(), queue=q)
+        return _CAPTURE["queue"]
+
+class _CaptureMiddleware:
+    """Middleware ASGI: copia la petición muestreada (cuerpo incluido) y la encola con su duración"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in CAPTURE_PATHS or random.random() >= CAPTURE_RATE:
+            return await self.app(scope, receive, send)
+        ts = time.time()
+        t0 = time.perf_counter()
+        body = bytearray()
+        status = [None]
+
+        async def receive_copy():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) <= CAPTURE_MAX_BODY:
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_copy, send_with_status)
+        finally:
+            record = {
+                "ts": ts,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status[0],
+                "duration_ms": (time.perf_counter() - t0) * 1e3,
+                "pid": os.getpid(),
+            }
+            if body:
+                try:
+                    record["body"] = json.loads(body) if len(body) <= CAPTURE_MAX_BODY else None
+                except ValueError:
+                    record["body"] = None
+                if record["body"] is None:
+                    record["body_bytes"] = len(body)  # no se pudo guardar (no es JSON o es muy grande)
+            line = json.dumps(record, ensure_ascii=False)
+            _capture_queue().put_nowait(logging.makeLogRecord({"msg": line, "levelno": logging.INFO}))
+
+if CAPTURE_RATE > 0:
+    app.add_middleware(_CaptureMiddleware)
+
 # --- rutas base: usa las carpetas del propio proyecto ---
 from pathlib import Path
 BASE = Path(__file__).resolve().parent
@@ -43,22 +617,160 @@ def _latest(pattern: str, folder: Path) -> Path:
         )
     return cands[-1]
 
-def _load_model_config(prefix: str):
+# --- plan de mapeo SiteInput → columnas del scaler ---
+# Mapeo inteligente usando coincidencia parcial para campos numéricos.
+# Esto evita problemas de encoding de caracteres especiales. El orden importa:
+# si una columna coincide con varios campos, gana el último (igual que antes).
+FIELD_MAPPING = {
+    "temperatura": ["temperatura", "temp"],
+    "humedadRelativa": ["humedad relativa"],
+    "intensidadLuminica": ["intensidad lumin"],
+    "pH": ["ph del suelo"],
+    "humedadSuelo": ["humedad del suelo"],
+    "carbonoOrganico": ["carbono organico"],
+    "nitrogenoTotal": ["nitrogeno total"],
+    "fosforoSoluble": ["fosforo soluble"],
+    "aguaPorcentual": ["peg", "agua"],
+    "nacl": ["nacl"],
+    "cd": ["cd ("],
+    "al": ["al ("],
+    "zn": ["zn ("],
+    "fe": ["fe ("],
+}
+
+# Columnas de textura (dummies) en el modelo
+TEXTURE_KEYWORDS = ["Franco", "Arenoso", "Arcilloso", "Limoso"]
+
+# Mapear entrada del usuario a nombres que pueden estar en el modelo
+# El modelo puede tener variaciones como "Franco-arenoso" vs "Arenoso"
+TEX_VARIANTS = {
+    "arenoso": ["Arenoso", "Arenosa"],
+    "franco-arenoso": ["Franco-arenoso", "Franco-arenosa", "Franco Arenoso"],
+    "franco": ["Franco"],
+    "franco-arcilloso": ["Franco-arcilloso", "Franco Arcilloso"],
+    "arcilloso": ["Arcilloso", "Arcillosa"],
+    "limoso": ["Limoso", "Limosa", "Limosos"],
+    "franco-limoso": ["Franco-limoso", "Franco Limoso"],
+}
+
+def _normalize_textura(value) -> str:
+    """Normaliza la textura escrita por el usuario a la forma de las llaves de TEX_VARIANTS"""
+    return str(value).strip().lower().replace(" ", "-")
+
+def _compile_feature_plan(num_cols: list) -> dict:
+    """Compila (una vez por cultivo) a qué columnas numéricas va cada campo de SiteInput.
+
+    Devuelve arreglos de índices listos para hacer scatter en NumPy, de modo que
+    preprocess() no tenga que recorrer columnas ni patrones en cada request.
+    """
+    texture_cols = [i for i, c in enumerate(num_cols) if any(x in c for x in TEXTURE_KEYWORDS)]
+    texture_set = set(texture_cols)
+
+    # Dueño final de cada columna: el último campo cuyo patrón coincide
+    owner: dict[int, str] = {}
+    for short_key, patterns in FIELD_MAPPING.items():
+        for i, col in enumerate(num_cols):
+            if i in texture_set:
+                continue  # Las texturas se manejan por separado
+            col_lower = col.lower()
+            if any(pattern.lower() in col_lower for pattern in patterns):
+                owner[i] = short_key
+
+    field_cols = {}
+    for short_key in FIELD_MAPPING:
+        idx = [i for i, k in owner.items() if k == short_key]
+        if idx:
+            field_cols[short_key] = np.array(sorted(idx), dtype=np.intp)
+
+    # Textura normalizada → índice de la columna a activar
+    texture_index: dict[str, int] = {}
+    for user_key, model_variants in TEX_VARIANTS.items():
+        for variant in model_variants:
+            hit = next((i for i in texture_cols if variant.lower() == num_cols[i].lower()), None)
+            if hit is not None:
+                texture_index[user_key] = hit
+                break
+
+    return {
+        "num_dim": len(num_cols),
+        "field_cols": field_cols,
+        "texture_cols": np.array(texture_cols, dtype=np.intp),
+        "texture_index": texture_index,
+        "unmapped": [i for i in range(len(num_cols)) if i not in owner and i not in texture_set],
+    }
+
+def _describe_feature_plan(plan: dict, num_cols: list) -> dict:
+    """Versión legible del plan (nombres de columna en lugar de índices) para /meta"""
+    return {
+        "fields": {k: [num_cols[i] for i in idx] for k, idx in plan["field_cols"].items()},
+        "unused_fields": [k for k in FIELD_MAPPING if k not in plan["field_cols"]],
+        "texture_columns": [num_cols[i] for i in plan["texture_cols"]],
+        "textures": {k: num_cols[plan["texture_index"][k]] if k in plan["texture_index"] else None
+                     for k in TEX_VARIANTS},
+        "unmapped_columns": [num_cols[i] for i in plan["unmapped"]],
+    }
+
+def _scaler_affine(scaler):
+    """Si el scaler es un StandardScaler, devuelve (mean, scale) para aplicarlo con NumPy.
+
+    Otros scalers con `scale_` (MinMaxScaler, RobustScaler, ...) usan otra fórmula
+    (`min_`, `center_`): para ellos devuelve None y se usa scaler.transform.
+    """
+    from sklearn.preprocessing import StandardScaler
+    if not isinstance(scaler, StandardScaler):
+        return None
+    n = int(scaler.n_features_in_)
+    mean = scaler.mean_ if scaler.with_mean else None
+    scale = scaler.scale_ if scaler.with_std else None
+    mean = np.zeros(n, dtype=np.float32) if mean is None else np.asarray(mean, dtype=np.float32)
+    scale = np.ones(n, dtype=np.float32) if scale is None else np.asarray(scale, dtype=np.float32)
+    return mean, scale
+
+def _artifact_paths(prefix: str, override_dir: Optional[Path] = None) -> dict[str, Path]:
+    """Rutas de los artefactos más recientes (por timestamp en el nombre) de un cultivo.
+
+    Con override_dir, los artefactos que estén ahí (p. ej. un checkpoint candidato) tienen prioridad.
+    """
+    patterns = {
+        "meta":   (f"{prefix}_site_meta*.json",      DIR_MODELS),
+        "panel":  (f"{prefix}_line_gene_panel*.json", DIR_MODELS),
+        "model":  (f"{prefix}_site_student*.pt",     DIR_MODELS),
+        "scaler": (f"{prefix}_scaler*.joblib",       DIR_PREPROC),
+        "ohe":    (f"{prefix}_ohe*.joblib",          DIR_PREPROC),
+        "cols":   (f"{prefix}_columns*.json",        DIR_PREPROC),
+    }
+    paths = {}
+    for key, (pattern, folder) in patterns.items():
+        override = sorted(Path(override_dir).glob(pattern)) if override_dir else []
+        paths[key] = override[-1] if override else _latest(pattern, folder)
+    return paths
+
+def _artifacts_version(paths: dict[str, Path]) -> str:
+    """Versión de un juego de artefactos: sufijo del checkpoint (timestamp) + huella de todos.
+
+    La huella cubre nombre, tamaño y mtime de cada artefacto, así que publicar solo un scaler,
+    OHE o meta nuevo (o reescribir uno con el mismo nombre) también cambia la versión, y con
+    ella la clave de la caché de predicciones.
+    """
+    stem = paths["model"].stem
+    readable = stem.split("_site_student", 1)[-1].lstrip("_") or stem
+    digest = hashlib.sha1(repr(sorted(_sources_stamp(paths).items())).encode("utf-8")).hexdigest()[:8]
+    return f"{readable}-{digest}"
+
+def _load_model_config(prefix: str, paths: Optional[dict[str, Path]] = None):
     """Carga configuración completa para un cultivo (modelo, scaler, metadatos, genes)"""
     try:
-        meta_path   = _latest(f"{prefix}_site_meta*.json",      DIR_MODELS)
-        panel_path  = _latest(f"{prefix}_line_gene_panel*.json", DIR_MODELS)
-        model_path  = _latest(f"{prefix}_site_student*.pt",     DIR_MODELS)
+        paths = paths or _artifact_paths(prefix)
+        meta_path   = paths["meta"]
+        panel_path  = paths["panel"]
+        model_path  = paths["model"]
+        scaler_path = paths["scaler"]
+        ohe_path    = paths["ohe"]
+        cols_path   = paths["cols"]
         
-        scaler_path = _latest(f"{prefix}_scaler*.joblib",       DIR_PREPROC)
-        ohe_path    = _latest(f"{prefix}_ohe*.joblib",          DIR_PREPROC)
-        cols_path   = _latest(f"{prefix}_columns*.json",        DIR_PREPROC)
-        
-        print(f"[DEBUG] Leyendo meta_path: {meta_path}")
+        print(f"Cargando {prefix}: {model_path.name}")
         with open(meta_path, "r", encoding="utf-8") as f:
-            content = f.read()
-            print(f"[DEBUG] Contenido meta_path:\n{content}")
-            meta = json.loads(content)
+            meta = json.load(f)
         class_names = meta.get("class_names", [])
         if not class_names:
             raise RuntimeError(f"class_names vacío en meta de {prefix}.")
@@ -96,6 +808,15 @@ def _load_model_config(prefix: str):
         
         input_dim = int(in_num + ohe_dim)
         n_classes = int(len(class_names))
+
+        # La parte categórica siempre llega vacía: su salida OHE es constante
+        cat_row = np.zeros((1, 0), dtype=np.float32)
+        if cat_cols:
+            try:
+                cat_row = np.asarray(ohe.transform(pd.DataFrame([{c: "" for c in cat_cols}])), dtype=np.float32)
+            except Exception as e:
+                print(f" OHE de {prefix} no acepta categorías vacías: {e}")
+                cat_row = None
         
         return {
             "meta": meta,
@@ -105,28 +826,21 @@ def _load_model_config(prefix: str):
             "cat_cols": cat_cols,
             "scaler": scaler,
             "ohe": ohe,
+            "feature_plan": _compile_feature_plan(num_cols),
+            "scaler_affine": _scaler_affine(scaler),
+            "cat_row": cat_row,
             "input_dim": input_dim,
             "n_classes": n_classes,
             "model_path": model_path,
+            "paths": paths,
+            "version": _artifacts_version(paths),
         }
     except Exception as e:
         raise RuntimeError(f"Error cargando configuración para {prefix}: {e}")
 
-# --- Cargar configuraciones de cultivos disponibles ---
-CULTIVOS_CONFIG = {}
-
 # Artefactos disponibles: sandia, tomate, maiz, gh, sorgo
 CULTIVOS_DISPONIBLES = ["sandia", "tomate", "maiz", "gh", "sorgo"]  # prefijos de archivos
 
-for cultivo_prefix in CULTIVOS_DISPONIBLES:
-    try:
-        CULTIVOS_CONFIG[cultivo_prefix] = _load_model_config(cultivo_prefix)
-    except Exception as e:
-        print(f" No se pudo cargar {cultivo_prefix}: {e}")
-
-if not CULTIVOS_CONFIG:
-    raise RuntimeError("No se pudo cargar ningún modelo de cultivo")
-
 # Mapeo de nombre amigable → prefix de archivo
 
 CULTIVO_MAP = {
@@ -138,40 +852,60 @@ CULTIVO_MAP = {
     "Sorgo": "sorgo",
 }
 
-# Para compatibilidad con código existente, usar red3 por defecto
-META = CULTIVOS_CONFIG["tomate"]["meta"]
-CLASS_NAMES = CULTIVOS_CONFIG["tomate"]["class_names"]
-GENE_PANEL = CULTIVOS_CONFIG["tomate"]["gene_panel"]
-COLS = {"numeric": CULTIVOS_CONFIG["tomate"]["num_cols"], "categorical": CULTIVOS_CONFIG["tomate"]["cat_cols"]}
-NUM_COLS = COLS.get("numeric", [])
-CAT_COLS = COLS.get("categorical", [])
-INPUT_DIM = CULTIVOS_CONFIG["tomate"]["input_dim"]
-N_CLASSES = CULTIVOS_CONFIG["tomate"]["n_classes"]
-
-import torch.nn as nn
-
-class StudentMLP(nn.Module):
-    def __init__(self, in_dim: int, n_classes: int, h1: int = 256, h2: int = 128, p: float = 0.1):
-        super().__init__()
-        self.net = nn.Sequential(
-            nn.Linear(in_dim, h1),
-            nn.ReLU(),
-            nn.Dropout(p),
-            nn.Linear(h1, h2),
-            nn.ReLU(),
-            nn.Dropout(p),
-            nn.Linear(h2, n_classes),
-        )
-    def forward(self, x):
-        return self.net(x)
+# Cultivo usado por /meta sin parámetros (compatibilidad con código existente)
+DEFAULT_CULTIVO = "tomate"
+
+# --- torch bajo demanda ---
+# Backend de inferencia por defecto y por cultivo
+INFERENCE_BACKEND = os.environ.get("ABIO_INFERENCE_BACKEND", "eager")
+CROP_BACKENDS = _crop_env_map("ABIO_CROP_BACKENDS")
+# Hilos intra-op de torch por proceso (0 = lo que decida torch); serve.py lo fija por worker
+TORCH_THREADS = int(os.environ.get("ABIO_TORCH_THREADS", "0"))
+
+torch = None
+nn = None
+StudentMLP = None
+
+def _ensure_torch():
+    """Importa torch y define StudentMLP la primera vez que se necesitan"""
+    global torch, nn, StudentMLP
+    if torch is not None:
+        return torch
+    import torch as _torch
+    import torch.nn as _nn
+    torch, nn = _torch, _nn
+    if TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+
+    class StudentMLP(nn.Module):
+        def __init__(self, in_dim: int, n_classes: int, h1: int = 256, h2: int = 128, p: float = 0.1):
+            super().__init__()
+            self.net = nn.Sequential(
+                nn.Linear(in_dim, h1),
+                nn.ReLU(),
+                nn.Dropout(p),
+                nn.Linear(h1, h2),
+                nn.ReLU(),
+                nn.Dropout(p),
+                nn.Linear(h2, n_classes),
+            )
+        def forward(self, x):
+            return self.net(x)
+
+    return torch
+
+# Con el backend numpy en todos los cultivos (y bundles vigentes) no hace falta importar torch
+if INFERENCE_BACKEND != "numpy" or any(b != "numpy" for b in CROP_BACKENDS.values()):
+    _ensure_torch()
 
-def _load_model_any(path: Path, input_dim: int, n_classes: int) -> nn.Module:
+def _load_model_any(path: Path, input_dim: int, n_classes: int) -> "nn.Module":
     """Carga un modelo PyTorch con las dimensiones especificadas.
 
     Si hay un mismatch en las dimensiones (por ejemplo, el checkpoint fue entrenado con
     distinto número de features), intenta inferir el input_dim desde el state_dict
     (peso de la primera capa) y reconstruir el modelo con esa dimensión.
     """
+    _ensure_torch()
     try:
         payload = torch.load(path, map_location="cpu")
     except Exception as e:
@@ -222,21 +956,6 @@ def _load_model_any(path: Path, input_dim: int, n_classes: int) -> nn.Module:
             raise RuntimeError(f"Error cargando state_dict desde {path}: {e}")
 
 
-# Cargar modelos para cada cultivo
-MODELOS = {}
-for cultivo_prefix, config in CULTIVOS_CONFIG.items():
-    try:
-        MODELOS[cultivo_prefix] = _load_model_any(
-            config["model_path"],
-            config["input_dim"],
-            config["n_classes"]
-        )
-    except Exception as e:
-        print(f"⚠️ Error cargando modelo para {cultivo_prefix}: {e}")
-
-if not MODELOS:
-    raise RuntimeError("No se pudo cargar ningún modelo")
-
 # --- esquema de entrada ---
 class SiteInput(BaseModel):
     cultivo: str  # "Sandía" o "Maíz"
@@ -256,218 +975,1747 @@ class SiteInput(BaseModel):
     zn: float
     fe: float
 
-def preprocess(inp: SiteInput, cultivo_prefix: str) -> torch.Tensor:
+def _expected_input_dim(crop: dict) -> Optional[int]:
+    """Dimensión de entrada que espera el modelo cargado (o la declarada en la config)"""
+    expected_dim = None
+    try:
+        layers = crop.get("layers")
+        model = crop.get("model")
+        if layers is not None:
+            expected_dim = int(layers[0][0].shape[1])
+        elif model is not None:
+            # StudentMLP tiene net[0] = Linear(in_dim, h1)
+            expected_dim = getattr(model.net[0], 'in_features', None)
+    except Exception:
+        expected_dim = None
+
+    if expected_dim is None:
+        expected_dim = crop.get('input_dim')
+    return expected_dim
+
+def _raw_features_from_columns(columns: dict, texturas, n: int, crop: dict) -> np.ndarray:
+    """Matriz numérica SIN escalar (N x num_cols) armada con el plan precompilado.
+
+    `columns` trae un arreglo de N valores por campo de SiteInput y `texturas` las N texturas.
+    """
+    plan = crop["feature_plan"]
+
+    # 1) Matriz numérica preasignada, con todas las columnas a 0
+    X_raw = np.zeros((n, plan["num_dim"]), dtype=np.float32)
+
+    # 2) Scatter de cada campo hacia sus columnas según el plan precompilado
+    for short_key, idx in plan["field_cols"].items():
+        vals = np.asarray(columns[short_key], dtype=np.float32)
+        X_raw[:, idx] = vals[:, None]
+
+    # 3) Textura: activar la columna correspondiente (las demás quedan en 0)
+    texture_index = plan["texture_index"]
+    for r, tex in enumerate(texturas):
+        c = texture_index.get(_normalize_textura(tex))
+        if c is not None:
+            X_raw[r, c] = 1.0
+
+    return X_raw
+
+def _raw_features(inps: list[SiteInput], crop: dict) -> np.ndarray:
+    """Matriz numérica SIN escalar (N x num_cols) para una lista de SiteInput"""
+    n = len(inps)
+    columns = {
+        short_key: np.fromiter((getattr(inp, short_key) for inp in inps), dtype=np.float32, count=n)
+        for short_key in crop["feature_plan"]["field_cols"]
+    }
+    return _raw_features_from_columns(columns, [inp.texturaSuelo for inp in inps], n, crop)
+
+def _model_features(X_raw: np.ndarray, crop: dict) -> np.ndarray:
+    """Escala la matriz cruda y agrega la parte categórica, ajustando a la dimensión del modelo"""
+    config = crop
+    n = X_raw.shape[0]
+
+    # 4) Escalado
+    affine = config["scaler_affine"]
+    if affine is not None:
+        mean, scale = affine
+        X_num = (X_raw - mean) / scale
+    else:
+        X_num = config["scaler"].transform(pd.DataFrame(X_raw, columns=config["num_cols"])).astype(np.float32)
+
+    # 5) Categóricas: salida OHE constante precalculada al cargar
+    cat_row = config["cat_row"]
+    if cat_row is None:
+        raise RuntimeError(f"El OneHotEncoder de {crop['prefix']} no acepta categorías vacías")
+
+    # Asegurar dimensión esperada por el modelo: si el modelo fue entrenado con más
+    # features que las que generamos con el preproc, rellenamos con ceros al final;
+    # si tenemos más, recortamos al tamaño esperado.
+    cur = int(X_num.shape[1] + cat_row.shape[1])
+    expected_dim = _expected_input_dim(crop)
+    expected_dim = cur if expected_dim is None else int(expected_dim)
+    if cur > expected_dim:
+        # Aviso en stdout para depuración ligera
+        print(f"Warning: preprocesador generó {cur} features; recortando {cur - expected_dim} columnas para coincidir con expected {expected_dim}.")
+
+    X = np.zeros((n, expected_dim), dtype=np.float32)
+    k = min(X_num.shape[1], expected_dim)
+    X[:, :k] = X_num[:, :k]
+    if cat_row.shape[1] and expected_dim > k:
+        m = min(cat_row.shape[1], expected_dim - k)
+        X[:, k:k + m] = cat_row[:, :m]
+
+    return X
+
+def preprocess_batch(inps: list[SiteInput], cultivo_prefix: str) -> "torch.Tensor":
+    """Preprocesa varios sitios del mismo cultivo en una sola matriz (N x input_dim)"""
+    _ensure_torch()
+    crop = CROPS.get(cultivo_prefix)
+    return torch.from_numpy(_model_features(_raw_features(inps, crop), crop))
+
+def preprocess(inp: SiteInput, cultivo_prefix: str) -> "torch.Tensor":
     """Preprocesa entrada para el cultivo especificado"""
-    config = CULTIVOS_CONFIG[cultivo_prefix]
-    num_cols = config["num_cols"]
-    cat_cols = config["cat_cols"]
-    scaler = config["scaler"]
-    ohe = config["ohe"]
-    
-    # 1) Convierto el payload a dict simple
-    d = inp.dict()
+    return preprocess_batch([inp], cultivo_prefix)
+
+# --- Modo fusionado: scaler + OHE constante absorbidos en la primera Linear ---
+FUSED_INFERENCE = os.environ.get("ABIO_FUSED_INFERENCE", "1") == "1"
+FUSE_TOLERANCE = float(os.environ.get("ABIO_FUSE_TOLERANCE", "1e-4"))
+FUSE_CHECK_ROWS = 256
+
+def _calibration_rows(crop: dict, n: int = FUSE_CHECK_ROWS, seed: int = 0) -> np.ndarray:
+    """Filas crudas sintéticas a partir de las estadísticas del scaler (para chequeos al cargar)"""
+    plan = crop["feature_plan"]
+    rng = np.random.default_rng(seed)
+    if crop["scaler_affine"] is not None:
+        mean, scale = crop["scaler_affine"]
+    else:
+        mean, scale = np.zeros(plan["num_dim"]), np.ones(plan["num_dim"])
+    X_raw = (mean + scale * rng.standard_normal((n, plan["num_dim"]))).astype(np.float32)
+    if len(plan["texture_cols"]):
+        X_raw[:, plan["texture_cols"]] = 0.0
+        pick = rng.integers(0, len(plan["texture_cols"]), n)
+        X_raw[np.arange(n), plan["texture_cols"][pick]] = 1.0
+    return X_raw
+
+def _sklearn_features(X_raw: np.ndarray, crop: dict) -> Optional[np.ndarray]:
+    """Entrada del modelo armada con scaler.transform / ohe.transform de sklearn.
+
+    Es la referencia de los chequeos al cargar: así la extracción de (mean, scale), la fila
+    OHE constante y la fusión se validan contra los transformadores originales y no contra
+    su reimplementación en NumPy. None si el cultivo viene de un bundle (sin objetos sklearn;
+    el bundle se validó así al generarlo y solo se usa con los mismos artefactos).
+    """
+    scaler, ohe = crop.get("scaler"), crop.get("ohe")
+    if scaler is None:
+        return None
+    n = X_raw.shape[0]
+    X_in = pd.DataFrame(X_raw, columns=crop["num_cols"]) if crop["num_cols"] else X_raw
+    parts = [np.asarray(scaler.transform(X_in), dtype=np.float32)]
+    if crop["cat_cols"]:
+        X_cat = ohe.transform(pd.DataFrame([{c: "" for c in crop["cat_cols"]}] * n))
+        parts.append(np.asarray(X_cat.toarray() if hasattr(X_cat, "toarray") else X_cat, dtype=np.float32))
+    combined = np.hstack(parts)
+    expected_dim = _expected_input_dim(crop) or combined.shape[1]
+    X = np.zeros((n, expected_dim), dtype=np.float32)
+    k = min(combined.shape[1], expected_dim)
+    X[:, :k] = combined[:, :k]
+    return X
+
+def _mlp_layers(model) -> Optional[list[tuple[np.ndarray, np.ndarray]]]:
+    """Pesos (W, b) de las Linear de un StudentMLP como arreglos float32; None si no es StudentMLP"""
+    if StudentMLP is None or not isinstance(model, StudentMLP):
+        return None
+    return [
+        (m.weight.detach().cpu().numpy().astype(np.float32), m.bias.detach().cpu().numpy().astype(np.float32))
+        for m in model.net if isinstance(m, nn.Linear)
+    ]
+
+def _fuse_layers(layers: Optional[list], crop: dict) -> Optional[list]:
+    """Capas equivalentes que reciben la matriz cruda (sin escalar) de _raw_features.
+
+    Con x_s = (x - mean) / scale, la primera capa W·[x_s, cat] + b queda como
+    (W_num / scale)·x + (b - W_num·(mean / scale) + W_cat·cat). Las columnas que el
+    preproc recorta tienen peso 0 y el relleno con ceros no aporta nada.
+    """
+    affine = crop["scaler_affine"]
+    cat_row = crop["cat_row"]
+    if layers is None or affine is None or cat_row is None:
+        return None
+
+    mean, scale = (a.astype(np.float64) for a in affine)
+    W, b = (a.astype(np.float64) for a in layers[0])
+    num_dim = crop["feature_plan"]["num_dim"]
+    expected_dim = int(W.shape[1])
+
+    k = min(num_dim, expected_dim)
+    m = min(cat_row.shape[1], expected_dim - k)
+    W_num = W[:, :k]
+
+    W_fused = np.zeros((W.shape[0], num_dim), dtype=np.float64)
+    W_fused[:, :k] = W_num / scale[:k]
+    b_fused = b - W_num @ (mean[:k] / scale[:k])
+    if m:
+        b_fused = b_fused + W[:, k:k + m] @ cat_row[0, :m].astype(np.float64)
+
+    return [(W_fused.astype(np.float32), b_fused.astype(np.float32))] + list(layers[1:])
+
+# --- Backends de inferencia: eager (torch), torchscript (congelado) y numpy ---
+INFERENCE_BACKENDS = ("eager", "torchscript", "numpy")
+BACKEND_TOLERANCE = float(os.environ.get("ABIO_BACKEND_TOLERANCE", "1e-4"))
+BACKEND_WARMUP_BATCHES = (1, 32)
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+def _numpy_engine(layers: list):
+    """Forward del MLP con matmul + ReLU de NumPy (sin torch)
+
+    Cada capa es (W, b) o, cuantizada a int8, (W_int8, b, escala por fila).
+    """
+    def forward(X: np.ndarray) -> np.ndarray:
+        h = X
+        for i, (W, b, *w_scale) in enumerate(layers):
+            h = h @ W.T  # int8/float16 se promueven a float32
+            if w_scale:
+                h *= w_scale[0]
+            h += b
+            if i < len(layers) - 1:
+                np.maximum(h, 0, out=h)
+        return _softmax(h)
+    return forward
+
+def _torch_module(layers: Optional[list], crop: dict) -> "nn.Module":
+    """Módulo torch para `layers` (reutiliza el modelo cargado si son sus propios pesos)"""
+    _ensure_torch()
+    model = crop.get("model")
+    if layers is None or (model is not None and layers is crop.get("layers")):
+        if model is None:
+            raise RuntimeError("no hay modelo torch para este cultivo")
+        return model
+    (W1, _), (W2, _), (W3, _) = layers
+    module = StudentMLP(W1.shape[1], W3.shape[0], h1=W1.shape[0], h2=W2.shape[0], p=crop.get("mlp_p") or 0.1)
+    linears = [m for m in module.net if isinstance(m, nn.Linear)]
+    with torch.no_grad():
+        for lin, (W, b) in zip(linears, layers):
+            lin.weight.copy_(torch.from_numpy(np.array(W)))
+            lin.bias.copy_(torch.from_numpy(np.array(b)))
+    module.eval()
+    return module
+
+def _torch_engine(module: "nn.Module"):
+    def forward(X: np.ndarray) -> np.ndarray:
+        with torch.no_grad():
+            return torch.softmax(module(torch.from_numpy(X)), dim=1).numpy()
+    return forward
+
+# --- Precisión reducida (opcional, por cultivo) ---
+QUANTIZE_MODES = ("int8", "float16")
+QUANTIZE = os.environ.get("ABIO_QUANTIZE", "")
+CROP_QUANTIZE = _crop_env_map("ABIO_CROP_QUANTIZE")
+QUANT_MAX_DRIFT = float(os.environ.get("ABIO_QUANT_MAX_DRIFT", "0.02"))
+QUANT_MIN_AGREEMENT = float(os.environ.get("ABIO_QUANT_MIN_AGREEMENT", "0.99"))
+QUANT_CHECK_ROWS = 2048
+
+def _quantize_layers(layers: list, mode: str) -> list:
+    """Pesos en float16, o int8 simétrico con una escala por neurona de salida"""
+    if mode == "float16":
+        return [(W.astype(np.float16), b) for W, b in layers]
+    quantized = []
+    for W, b in layers:
+        w_scale = np.abs(W).max(axis=1) / 127.0
+        w_scale[w_scale == 0] = 1.0
+        W_q = np.clip(np.round(W / w_scale[:, None]), -127, 127).astype(np.int8)
+        quantized.append((W_q, b, w_scale.astype(np.float32)))
+    return quantized
+
+def _quantize_module(module: "nn.Module", mode: str) -> "nn.Module":
+    """Cuantización dinámica de las Linear (int8) o pesos guardados en float16"""
+    dtype = torch.qint8 if mode == "int8" else torch.float16
+    return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=dtype)
+
+def _weight_bytes(layers: Optional[list], mode: Optional[str] = None) -> Optional[int]:
+    """Tamaño de una copia de los pesos del MLP en fp32 o en el modo cuantizado"""
+    if layers is None:
+        return None
+    per_weight = {None: 4, "float16": 2, "int8": 1}[mode]
+    total = 0
+    for W, b in layers:
+        total += W.size * per_weight + b.nbytes
+        if mode == "int8":
+            total += W.shape[0] * 4
+    return int(total)
+
+def _resident_weight_bytes(*holders) -> int:
+    """Bytes de pesos realmente en memoria entre todas las copias de un cultivo.
+
+    `holders` son listas de capas (W, b[, escala]) o módulos torch. Los buffers que comparten
+    memoria (la misma capa en dos listas, un módulo que reutiliza el modelo) se cuentan una vez.
+    """
+    buffers: dict[tuple, int] = {}
+
+    def visit(obj):
+        if obj is None:
+            return
+        if isinstance(obj, np.ndarray):
+            key = ("ptr", obj.__array_interface__["data"][0])
+            buffers[key] = max(buffers.get(key, 0), obj.nbytes)
+        elif isinstance(obj, (list, tuple)):
+            for item in obj:
+                visit(item)
+        elif torch is not None and isinstance(obj, torch.Tensor):
+            key = ("ptr", obj.data_ptr())
+            buffers[key] = max(buffers.get(key, 0), obj.nelement() * obj.element_size())
+        elif torch is not None and isinstance(obj, nn.Module):
+            for sub in obj.modules():
+                packed = getattr(sub, "_packed_params", None)
+                if packed is not None and hasattr(packed, "_weight_bias"):
+                    # Linear cuantizada: el peso empaquetado no se expone; se cuenta por su dtype
+                    W, b = packed._weight_bias()
+                    per_weight = 2 if packed.dtype == torch.float16 else W.element_size()
+                    buffers[("packed", id(packed))] = W.nelement() * per_weight + b.nelement() * b.element_size()
+                else:
+                    visit(list(sub.parameters(recurse=False)) + list(sub.buffers(recurse=False)))
 
-    # 2) Construyo una fila con TODAS las columnas numéricas inicializadas a 0
-    row = {col: 0.0 for col in num_cols}
-    
-    # 3) Identificar columnas de textura (dummies) en el modelo
-    TEXTURE_COLUMNS = [c for c in num_cols if any(x in c for x in ["Franco", "Arenoso", "Arcilloso", "Limoso"])]
-
-    # 4) Mapeo inteligente usando coincidencia parcial para campos numéricos
-    # Esto evita problemas de encoding de caracteres especiales
-    field_mapping = {
-        "temperatura": ["temperatura", "temp"],
-        "humedadRelativa": ["humedad relativa"],
-        "intensidadLuminica": ["intensidad lumin"],
-        "pH": ["ph del suelo"],
-        "humedadSuelo": ["humedad del suelo"],
-        "carbonoOrganico": ["carbono organico"],
-        "nitrogenoTotal": ["nitrogeno total"],
-        "fosforoSoluble": ["fosforo soluble"],
-        "aguaPorcentual": ["peg", "agua"],
-        "nacl": ["nacl"],
-        "cd": ["cd ("],
-        "al": ["al ("],
-        "zn": ["zn ("],
-        "fe": ["fe ("],
+    for holder in holders:
+        visit(holder)
+    return int(sum(buffers.values()))
+
+def _build_engine(backend: str, layers: Optional[list], crop: dict, in_dim: int, quantize: Optional[str] = None):
+    """callable X -> probs para el backend pedido; X es la entrada que esperan `layers`.
+
+    El callable lleva en `.weights` los pesos que mantiene vivos (para _resident_weight_bytes).
+    """
+    if backend == "numpy":
+        if layers is None:
+            raise RuntimeError("el backend numpy requiere un checkpoint StudentMLP")
+        run = _quantize_layers(layers, quantize) if quantize else layers
+        engine = _numpy_engine(run)
+        engine.weights = run
+        return engine
+    module = _torch_module(layers, crop)
+    if quantize:
+        module = _quantize_module(module, quantize)
+    if backend == "torchscript":
+        # freeze() deja los pesos como constantes del grafo: se cuentan con el módulo original
+        engine = _torch_engine(torch.jit.freeze(torch.jit.script(module).eval()))
+        engine.weights = module
+        # Calentamiento: las primeras llamadas optimizan el grafo, no las paga un usuario
+        for n in BACKEND_WARMUP_BATCHES:
+            for _ in range(3):
+                engine(np.zeros((n, in_dim), dtype=np.float32))
+        return engine
+    if backend != "eager":
+        raise RuntimeError(f"backend desconocido: {backend}")
+    engine = _torch_engine(module)
+    engine.weights = module
+    return engine
+
+def _attach_engine(crop: dict):
+    """Elige pesos (fusionados o no) y backend de un cultivo, validándolos contra el modelo original.
+
+    La referencia es el modelo eager sin fusionar (o NumPy sin fusionar si torch no está
+    cargado), evaluado sobre filas de calibración sintéticas preprocesadas con el scaler y
+    el OHE de sklearn. La fusión solo se usa si queda dentro de FUSE_TOLERANCE; un backend
+    que supere BACKEND_TOLERANCE se reemplaza por eager.
+    """
+    prefix = crop["prefix"]
+    layers = crop.get("layers")
+    if crop.get("model") is not None:
+        reference = _torch_engine(crop["model"])
+    else:
+        reference = _numpy_engine(layers)
+    X_cal = _calibration_rows(crop)
+    X_model = _model_features(X_cal, crop)
+    X_sklearn = _sklearn_features(X_cal, crop)
+    ref = reference(X_sklearn if X_sklearn is not None else X_model)
+
+    fused_layers = None
+    crop["fuse_check"] = None
+    if FUSED_INFERENCE:
+        fused_layers = _fuse_layers(layers, crop)
+        if fused_layers is None:
+            crop["fuse_check"] = {"enabled": False, "reason": "modelo o scaler no fusionable"}
+        else:
+            max_diff = float(np.abs(_numpy_engine(fused_layers)(X_cal) - ref).max())
+            ok = max_diff <= FUSE_TOLERANCE
+            crop["fuse_check"] = {
+                "enabled": ok, "max_abs_diff": max_diff, "tolerance": FUSE_TOLERANCE,
+                "reference": "sklearn" if X_sklearn is not None else "numpy",
+            }
+            if not ok:
+                print(f"⚠️ Fusión descartada para {prefix}: diferencia {max_diff:.2e} > {FUSE_TOLERANCE:.0e}")
+                fused_layers = None
+    crop["fused"] = fused_layers is not None
+    run_layers = fused_layers if crop["fused"] else layers
+    crop["run_layers"] = run_layers  # fp32, también para MC dropout
+    X_in = X_cal if crop["fused"] else X_model
+
+    backend = CROP_BACKENDS.get(prefix, INFERENCE_BACKEND)
+    try:
+        engine = _build_engine(backend, run_layers, crop, X_in.shape[1])
+        max_diff = float(np.abs(engine(X_in) - ref).max())
+        if max_diff > BACKEND_TOLERANCE:
+            raise RuntimeError(f"diferencia {max_diff:.2e} > {BACKEND_TOLERANCE:.0e}")
+    except Exception as e:
+        if backend == "eager":
+            raise
+        print(f"⚠️ Backend {backend} descartado para {prefix}: {e}; usando eager")
+        backend = "eager"
+        engine = _build_engine(backend, run_layers, crop, X_in.shape[1])
+        max_diff = float(np.abs(engine(X_in) - ref).max())
+    crop["backend"] = backend
+    crop["backend_check"] = {"max_abs_diff": max_diff, "tolerance": BACKEND_TOLERANCE}
+
+    # Precisión reducida: se acepta solo si casi no cambia la línea predicha ni las probabilidades
+    mode = CROP_QUANTIZE.get(prefix, QUANTIZE) or None
+    crop["quantize"] = None
+    crop["quant_check"] = None
+    if mode:
+        check = {
+            "mode": mode,
+            "accepted": False,
+            "max_prob_drift_limit": QUANT_MAX_DRIFT,
+            "min_agreement": QUANT_MIN_AGREEMENT,
+        }
+        try:
+            if mode not in QUANTIZE_MODES:
+                raise RuntimeError(f"modo desconocido (usar {', '.join(QUANTIZE_MODES)})")
+            X_q = _calibration_rows(crop, QUANT_CHECK_ROWS, seed=1)
+            X_q_model = _model_features(X_q, crop)
+            ref_q = reference(X_q_model)
+            q_engine = _build_engine(backend, run_layers, crop, X_in.shape[1], quantize=mode)
+            probs = q_engine(X_q if crop["fused"] else X_q_model)
+            check["agreement"] = float((probs.argmax(axis=1) == ref_q.argmax(axis=1)).mean())
+            check["max_prob_drift"] = float(np.abs(probs - ref_q).max())
+            # Copia adicional: los pesos fp32 siguen residentes (MC dropout, atribución, bundles)
+            check["extra_weight_bytes"] = _weight_bytes(run_layers, mode)
+            check["accepted"] = (
+                check["agreement"] >= QUANT_MIN_AGREEMENT and check["max_prob_drift"] <= QUANT_MAX_DRIFT
+            )
+        except Exception as e:
+            check["error"] = str(e)
+        if check["accepted"]:
+            engine = q_engine
+            crop["quantize"] = mode
+        else:
+            print(f"⚠️ Cuantización {mode} rechazada para {prefix}: "
+                  f"{check.get('error') or (check['agreement'], check['max_prob_drift'])}")
+        crop["quant_check"] = check
+
+    crop["weight_bytes"] = _resident_weight_bytes(layers, run_layers, crop.get("model"), engine.weights)
+    if crop["fused"]:
+        crop["engine"] = engine
+    else:
+        crop["engine"] = lambda X_raw: engine(_model_features(X_raw, crop))
+
+# --- Bundles precompilados (arranque en frío rápido) ---
+# Un bundle reúne todo lo que un cultivo necesita para servir: class_names, plan de
+# features, parámetros del scaler, pesos del MLP y panel de genes. Formato:
+#   BUNDLE_MAGIC | largo del header (uint64 LE) | header JSON | arreglos alineados a 64 bytes
+# Los arreglos se leen con np.memmap, sin joblib ni torch.load. Se genera con
+# `python build_bundles.py` y solo se usa si los artefactos de origen no cambiaron.
+BUNDLES_DIR = BASE / "bundles"
+USE_BUNDLES = os.environ.get("ABIO_USE_BUNDLES", "1") == "1"
+BUNDLE_MAGIC = b"ABIOBNDL"
+BUNDLE_FORMAT = 1
+BUNDLE_ALIGN = 64
+STUDENT_LINEAR_IDX = (0, 3, 6)  # posiciones de las Linear dentro de StudentMLP.net
+
+def _sources_stamp(paths: dict[str, Path]) -> dict:
+    return {role: [p.name, p.stat().st_size, p.stat().st_mtime_ns] for role, p in paths.items()}
+
+def _sources_checksum(paths: dict[str, Path]) -> str:
+    """sha256 del contenido de los artefactos de origen (en orden de rol)"""
+    h = hashlib.sha256()
+    for role in sorted(paths):
+        h.update(role.encode())
+        h.update(paths[role].name.encode())
+        h.update(paths[role].read_bytes())
+    return h.hexdigest()
+
+def _plan_to_json(plan: dict) -> dict:
+    return {
+        "num_dim": plan["num_dim"],
+        "field_cols": {k: idx.tolist() for k, idx in plan["field_cols"].items()},
+        "texture_cols": plan["texture_cols"].tolist(),
+        "texture_index": plan["texture_index"],
+        "unmapped": plan["unmapped"],
     }
-    
-    # 5) Rellenar valores numéricos usando coincidencia de patrones
-    for short_key, patterns in field_mapping.items():
-        if short_key in d:
-            val = d[short_key]
-            try:
-                val = float(val)
-            except Exception:
-                val = 0.0
-            
-            # Buscar y llenar todas las columnas que coincidan
-            for col in num_cols:
-                if col in TEXTURE_COLUMNS:
-                    continue  # Las texturas se manejan por separado
-                    
-                col_lower = col.lower()
-                for pattern in patterns:
-                    if pattern.lower() in col_lower:
-                        row[col] = val
-                        break
-
-    # 6) Mapeo de textura - normalizar el input del usuario
-    tex = str(d.get("texturaSuelo", "")).strip().lower()
-    
-    # Mapeo flexible de textura del usuario a las columnas del modelo
-    # El modelo puede tener variaciones como "Franco-arenoso" vs "Arenoso"
-    tex_normalized = tex.replace(" ", "-").lower()
-    
-    # Mapear entrada del usuario a nombres que pueden estar en el modelo
-    TEX_VARIANTS = {
-        "arenoso": ["Arenoso", "Arenosa"],
-        "franco-arenoso": ["Franco-arenoso", "Franco-arenosa", "Franco Arenoso"],
-        "franco": ["Franco"],
-        "franco-arcilloso": ["Franco-arcilloso", "Franco Arcilloso"],
-        "arcilloso": ["Arcilloso", "Arcillosa"],
-        "limoso": ["Limoso", "Limosa", "Limosos"],
-        "franco-limoso": ["Franco-limoso", "Franco Limoso"],
+
+def _plan_from_json(d: dict) -> dict:
+    return {
+        "num_dim": d["num_dim"],
+        "field_cols": {k: np.array(idx, dtype=np.intp) for k, idx in d["field_cols"].items()},
+        "texture_cols": np.array(d["texture_cols"], dtype=np.intp),
+        "texture_index": d["texture_index"],
+        "unmapped": d["unmapped"],
     }
-    
-    # Encontrar qué columna del modelo activar
-    matched_col = None
-    for user_key, model_variants in TEX_VARIANTS.items():
-        if tex_normalized == user_key:
-            # Buscar cuál de las variantes existe en las columnas del modelo
-            for variant in model_variants:
-                for c in TEXTURE_COLUMNS:
-                    if variant.lower() == c.lower():
-                        matched_col = c
-                        break
-                if matched_col:
-                    break
+
+def _write_aligned_file(out_path: Path, magic: bytes, header: dict, arrays: dict[str, np.ndarray]):
+    """MAGIC | largo del header | header JSON | arreglos alineados; header["arrays"] guarda su ubicación"""
+    header["arrays"] = {}
+
+    # Los offsets dependen del largo del header: se calculan con el header ya serializado
+    def layout(start: int) -> int:
+        pos = start
+        for name, arr in arrays.items():
+            pos = -(-pos // BUNDLE_ALIGN) * BUNDLE_ALIGN
+            header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": pos}
+            pos += arr.nbytes
+        return pos
+
+    layout(0)
+    while True:
+        blob = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        data_start = -(-(len(magic) + 8 + len(blob)) // BUNDLE_ALIGN) * BUNDLE_ALIGN
+        before = dict(header["arrays"])
+        layout(data_start)
+        if header["arrays"] == before:
             break
-    
-    # Activar la columna correspondiente
-    for c in TEXTURE_COLUMNS:
-        if c in row:
-            row[c] = 1.0 if (matched_col and c == matched_col) else 0.0
-
-    # 7) Crea DataFrame CON LOS NOMBRES EXACTOS DE LAS COLUMNAS
-    df_num = pd.DataFrame([row], columns=num_cols)
-
-    # 8) Categóricas
-    if cat_cols:
-        df_cat = pd.DataFrame([{c: "" for c in cat_cols}])
-        X_cat = ohe.transform(df_cat)
-    else:
-        X_cat = np.zeros((1, 0), dtype=np.float32)
 
-    # 9) Escalado
-    X_num = scaler.transform(df_num).astype(np.float32)
-    X = np.hstack([X_num, X_cat]).astype(np.float32)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(magic)
+        f.write(len(blob).to_bytes(8, "little"))
+        f.write(blob)
+        for name, arr in arrays.items():
+            f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp_path, out_path)
+
+def _read_aligned_file(path: Path, magic: bytes) -> tuple[dict, dict[str, np.ndarray]]:
+    """Header y arreglos (vistas de solo lectura sobre el archivo mapeado) de _write_aligned_file"""
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+    if bytes(mm[:len(magic)]) != magic:
+        raise RuntimeError(f"{path.name}: encabezado desconocido")
+    n = int.from_bytes(bytes(mm[len(magic):len(magic) + 8]), "little")
+    start = len(magic) + 8
+    header = json.loads(bytes(mm[start:start + n]).decode("utf-8"))
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype = np.dtype(spec["dtype"])
+        count = int(np.prod(spec["shape"])) if spec["shape"] else 1
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=spec["offset"]).reshape(spec["shape"])
+    return header, arrays
+
+def write_crop_bundle(crop: dict, out_dir: Path = BUNDLES_DIR) -> Path:
+    """Escribe el bundle de un cultivo ya cargado desde sus artefactos originales"""
+    layers = crop.get("layers")
+    if layers is None:
+        raise RuntimeError(f"{crop['prefix']}: solo se pueden empaquetar checkpoints StudentMLP")
+    if crop["scaler_affine"] is None or crop["cat_row"] is None:
+        raise RuntimeError(f"{crop['prefix']}: el scaler/OHE no se puede expresar como parámetros fijos")
+
+    mean, scale = crop["scaler_affine"]
+    arrays = {"scaler_mean": mean, "scaler_scale": scale, "cat_row": crop["cat_row"]}
+    for idx, (W, b) in zip(STUDENT_LINEAR_IDX, layers):
+        arrays[f"model/net.{idx}.weight"] = W
+        arrays[f"model/net.{idx}.bias"] = b
+    arrays = {k: np.ascontiguousarray(v, dtype=np.float32) for k, v in arrays.items()}
+
+    header = {
+        "format": BUNDLE_FORMAT,
+        "prefix": crop["prefix"],
+        "version": crop["version"],
+        "built_at": time.time(),
+        "sources": _sources_stamp(crop["paths"]),
+        "sources_sha256": _sources_checksum(crop["paths"]),
+        "meta": crop["meta"],
+        "class_names": crop["class_names"],
+        "gene_panel": crop["gene_panel"],
+        "num_cols": crop["num_cols"],
+        "cat_cols": crop["cat_cols"],
+        "input_dim": crop["input_dim"],
+        "n_classes": crop["n_classes"],
+        "feature_plan": _plan_to_json(crop["feature_plan"]),
+        "mlp": {
+            "in_dim": int(layers[0][0].shape[1]),
+            "h1": int(layers[0][0].shape[0]),
+            "h2": int(layers[1][0].shape[0]),
+            "p": float(crop.get("mlp_p") or 0.1),
+        },
+    }
 
-    # Asegurar dimensión esperada por el modelo: si el modelo fue entrenado con más
-    # features que las que generamos con el preproc, rellenamos con ceros al final.
-    expected_dim = None
+    out_path = Path(out_dir) / f"{crop['prefix']}_bundle_{crop['version']}.bin"
+    _write_aligned_file(out_path, BUNDLE_MAGIC, header, arrays)
+    return out_path
+
+def read_crop_bundle(path: Path) -> tuple[dict, dict[str, np.ndarray]]:
+    """Header y arreglos (vistas de solo lectura sobre el archivo mapeado) de un bundle"""
+    header, arrays = _read_aligned_file(path, BUNDLE_MAGIC)
+    if header.get("format") != BUNDLE_FORMAT:
+        raise RuntimeError(f"{path.name}: formato de bundle {header.get('format')} no soportado")
+    return header, arrays
+
+def _bundle_is_fresh(header: dict, paths: dict[str, Path]) -> bool:
+    """El bundle sirve si sus artefactos de origen son los mismos que los actuales"""
+    recorded = header.get("sources", {})
+    if {role: v[0] for role, v in recorded.items()} != {role: p.name for role, p in paths.items()}:
+        return False
+    if recorded == _sources_stamp(paths):
+        return True
+    # Mismos nombres pero distinto mtime/tamaño: decide el contenido
+    return header.get("sources_sha256") == _sources_checksum(paths)
+
+def _load_crop_from_bundle(prefix: str, paths: dict[str, Path]) -> Optional[dict]:
+    """Entrada del registro desde el bundle más reciente, o None si no hay uno vigente"""
+    bundle_path = next(iter(sorted(BUNDLES_DIR.glob(f"{prefix}_bundle_*.bin"), reverse=True)), None)
+    if bundle_path is None:
+        return None
+    header, arrays = read_crop_bundle(bundle_path)
+    if not _bundle_is_fresh(header, paths):
+        print(f"Bundle de {prefix} desactualizado ({bundle_path.name}); usando artefactos originales")
+        return None
+
+    # Los pesos quedan como vistas sobre el archivo mapeado (compartidas entre procesos)
+    layers = [(arrays[f"model/net.{i}.weight"], arrays[f"model/net.{i}.bias"]) for i in STUDENT_LINEAR_IDX]
+
+    crop = {
+        "meta": header["meta"],
+        "class_names": header["class_names"],
+        "gene_panel": header["gene_panel"],
+        "num_cols": header["num_cols"],
+        "cat_cols": header["cat_cols"],
+        "scaler": None,
+        "ohe": None,
+        "feature_plan": _plan_from_json(header["feature_plan"]),
+        "scaler_affine": (arrays["scaler_mean"], arrays["scaler_scale"]),
+        "cat_row": np.array(arrays["cat_row"]),
+        "input_dim": header["input_dim"],
+        "n_classes": header["n_classes"],
+        "model_path": paths["model"],
+        "paths": paths,
+        "version": _artifacts_version(paths),
+        "layers": layers,
+        "mlp_p": header["mlp"]["p"],
+        "model": None,
+        "source": "bundle",
+        "bundle_path": bundle_path,
+    }
+    # El modelo torch solo se arma si torch ya está cargado (backends eager/torchscript)
+    if torch is not None:
+        crop["model"] = _torch_module(layers, crop)
+    return crop
+
+def _load_crop(prefix: str, paths: Optional[dict[str, Path]] = None, use_bundle: bool = USE_BUNDLES) -> dict:
+    """Carga todos los artefactos de un cultivo en una entrada autocontenida del registro"""
+    t0 = time.perf_counter()
+    paths = paths or _artifact_paths(prefix)
+    crop = None
+    if use_bundle:
+        try:
+            crop = _load_crop_from_bundle(prefix, paths)
+        except Exception as e:
+            print(f"⚠️ No se pudo leer el bundle de {prefix}: {e}")
+    if crop is None:
+        crop = _load_model_config(prefix, paths)
+        model = _load_model_any(crop["model_path"], crop["input_dim"], crop["n_classes"])
+        crop["model"] = model
+        crop["layers"] = _mlp_layers(model)
+        crop["mlp_p"] = float(model.net[2].p) if crop["layers"] is not None else None
+        crop["source"] = "artifacts"
+    crop["prefix"] = prefix
+    _attach_engine(crop)
+    crop["loaded_at"] = time.time()
+    crop["load_seconds"] = time.perf_counter() - t0
+    # Tamaño en disco de lo que se leyó (bundle o artefactos originales)
+    sources = [crop["bundle_path"]] if crop["source"] == "bundle" else [p for p in paths.values() if p]
+    crop["artifact_bytes"] = sum(p.stat().st_size for p in sources if p.exists())
+    crop["artifacts_mtime"] = max((p.stat().st_mtime for p in paths.values() if p and p.exists()), default=None)
+    if METRICS_ENABLED:
+        CROP_LOAD_LATENCY.observe(crop["load_seconds"], prefix, crop["source"])
+    return crop
+
+# --- Registro de cultivos: carga perezosa, LRU y recarga en caliente ---
+MAX_RESIDENT_CROPS = int(os.environ.get("ABIO_MAX_RESIDENT_CROPS", str(len(CULTIVOS_DISPONIBLES))))
+RELOAD_INTERVAL_S = float(os.environ.get("ABIO_RELOAD_INTERVAL_S", "10"))
+PRELOAD_CROPS = os.environ.get("ABIO_PRELOAD_CROPS", "")
+
+# --- Caché de predicciones ---
+PREDICT_CACHE_SIZE = int(os.environ.get("ABIO_PREDICT_CACHE_SIZE", "10000"))  # 0 la desactiva
+# Decimales a los que se redondea cada feature para la clave ("" = valor exacto)
+_cache_decimals = os.environ.get("ABIO_PREDICT_CACHE_DECIMALS", "")
+PREDICT_CACHE_DECIMALS = int(_cache_decimals) if _cache_decimals else None
+
+class _PredictionCache:
+    """LRU de probabilidades por (cultivo, versión, vector de features crudo).
+
+    El vector crudo (después de normalizar texturas y mapear campos) determina por completo
+    la entrada del modelo para una versión dada, así que sirve de clave canónica.
+    """
+
+    def __init__(self, max_size: int, decimals: Optional[int]):
+        self.max_size = max(1, max_size)
+        self.decimals = decimals
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, np.ndarray] = OrderedDict()
+        self._stats: dict[str, dict] = {}
+
+    def key(self, crop: dict, x_raw: np.ndarray) -> tuple:
+        x = np.asarray(x_raw, dtype=np.float32)
+        if self.decimals is not None:
+            x = np.round(x, self.decimals) + np.float32(0.0)  # +0.0 unifica -0.0 y 0.0
+        return (crop["prefix"], crop["version"], x.tobytes())
+
+    def _crop_stats(self, prefix: str) -> dict:
+        return self._stats.setdefault(prefix, {"hits": 0, "misses": 0, "invalidated": 0})
+
+    def get_many(self, prefix: str, keys: list[tuple]) -> list[Optional[np.ndarray]]:
+        with self._lock:
+            stats = self._crop_stats(prefix)
+            found = []
+            for key in keys:
+                probs = self._entries.get(key)
+                if probs is not None:
+                    self._entries.move_to_end(key)
+                    stats["hits"] += 1
+                else:
+                    stats["misses"] += 1
+                found.append(probs)
+            return found
+
+    def put(self, key: tuple, probs: np.ndarray):
+        probs = np.array(probs, dtype=np.float32)
+        probs.setflags(write=False)
+        with self._lock:
+            self._entries[key] = probs
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict_crop(self, prefix: str) -> int:
+        """Descarta todas las entradas de un cultivo (p. ej. al cambiar de versión)"""
+        with self._lock:
+            stale = [k for k in self._entries if k[0] == prefix]
+            for k in stale:
+                del self._entries[k]
+            self._crop_stats(prefix)["invalidated"] += len(stale)
+            return len(stale)
+
+    def stats(self) -> dict:
+        def rate(st):
+            total = st["hits"] + st["misses"]
+            return st["hits"] / total if total else 0.0
+
+        with self._lock:
+            sizes: dict[str, int] = {}
+            for k in self._entries:
+                sizes[k[0]] = sizes.get(k[0], 0) + 1
+            cultivos = {
+                prefix: {**st, "size": sizes.get(prefix, 0), "hit_rate": rate(st)}
+                for prefix, st in self._stats.items()
+            }
+            hits = sum(st["hits"] for st in self._stats.values())
+            misses = sum(st["misses"] for st in self._stats.values())
+            return {
+                "size": len(self._entries),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": rate({"hits": hits, "misses": misses}),
+                "cultivos": cultivos,
+            }
+
+PREDICT_CACHE = _PredictionCache(PREDICT_CACHE_SIZE, PREDICT_CACHE_DECIMALS) if PREDICT_CACHE_SIZE > 0 else None
+
+class _CropRegistry:
+    """Cultivos residentes en memoria.
+
+    Un cultivo se carga la primera vez que se pide; si hay más de `max_resident`, se
+    descarga el usado hace más tiempo. Un hilo revisa cada `reload_interval_s` si
+    `_latest()` apunta a artefactos nuevos y, si es así, carga la nueva versión aparte
+    y la intercambia de golpe: las peticiones en curso conservan su entrada anterior.
+    """
+
+    def __init__(self, prefixes: list[str], max_resident: int, reload_interval_s: float):
+        self.prefixes = list(prefixes)
+        self.max_resident = max(1, max_resident)
+        self.reload_interval_s = reload_interval_s
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._load_locks = {p: threading.Lock() for p in self.prefixes}
+        self._errors: dict[str, dict] = {}
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_stop = threading.Event()
+        self._watcher_held = False  # en el padre de serve.py: vigilan los workers, no él
+        self._evictions = 0
+        self._reloads = 0
+
+    def get(self, prefix: str) -> dict:
+        """Entrada del cultivo, cargándola si no está residente"""
+        if prefix not in self._load_locks:
+            raise KeyError(f"Cultivo desconocido: {prefix}")
+        with self._lock:
+            crop = self._entries.get(prefix)
+            if crop is not None:
+                self._entries.move_to_end(prefix)
+                return crop
+            err = self._errors.get(prefix)
+            if err and time.time() - err["at"] < self.reload_interval_s:
+                raise RuntimeError(err["error"])
+
+        # Un solo hilo carga cada cultivo; los demás esperan y reutilizan la entrada
+        with self._load_locks[prefix]:
+            with self._lock:
+                crop = self._entries.get(prefix)
+            if crop is None:
+                try:
+                    crop = _load_crop(prefix)
+                except Exception as e:
+                    print(f" No se pudo cargar {prefix}: {e}")
+                    with self._lock:
+                        self._errors[prefix] = {"error": str(e), "at": time.time()}
+                    raise
+                self._install(prefix, crop)
+        self._ensure_watcher()
+        return crop
+
+    def _install(self, prefix: str, crop: dict):
+        with self._lock:
+            self._errors.pop(prefix, None)
+            self._entries[prefix] = crop
+            self._entries.move_to_end(prefix)
+            while len(self._entries) > self.max_resident:
+                old, _ = self._entries.popitem(last=False)
+                self._evictions += 1
+                print(f"Descargando {old} (LRU, máximo {self.max_resident} cultivos residentes)")
+
+    def resident(self) -> list[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def entries(self) -> dict[str, dict]:
+        """Copia de {prefix: entrada} de los cultivos residentes"""
+        with self._lock:
+            return dict(self._entries)
+
+    def check_updates(self):
+        """Recarga los cultivos residentes cuyos artefactos más recientes cambiaron"""
+        for prefix in self.resident():
+            with self._lock:
+                current = self._entries.get(prefix)
+            if current is None:
+                continue
+            try:
+                paths = _artifact_paths(prefix)
+            except FileNotFoundError:
+                continue
+            if paths == current["paths"]:
+                continue
+            with self._load_locks[prefix]:
+                try:
+                    crop = _load_crop(prefix, paths)
+                except Exception as e:
+                    # Se sigue sirviendo la versión anterior
+                    print(f"⚠️ No se pudo recargar {prefix}: {e}")
+                    with self._lock:
+                        self._errors[prefix] = {"error": str(e), "at": time.time()}
+                    continue
+                with self._lock:
+                    if prefix not in self._entries:
+                        continue
+                    self._entries[prefix] = crop
+                    self._errors.pop(prefix, None)
+                    self._reloads += 1
+                if PREDICT_CACHE is not None:
+                    PREDICT_CACHE.evict_crop(prefix)
+                print(f"Recargado {prefix}: {current['version']} → {crop['version']}")
+
+    def hold_watcher(self):
+        """Detiene el hilo vigía y no lo arranca en este proceso (ver prepare_for_fork)"""
+        with self._lock:
+            self._watcher_held = True
+            self._watcher_stop.set()
+            self._watcher = None
+
+    def _after_fork(self):
+        """En un proceso hijo: locks nuevos y un hilo vigía propio (los hilos no sobreviven al fork).
+
+        Con prepare_for_fork los cultivos ya están residentes y get() no vuelve a pasar por
+        _ensure_watcher, así que el vigía se arranca aquí.
+        """
+        self._lock = threading.Lock()
+        self._load_locks = {p: threading.Lock() for p in self.prefixes}
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+        self._watcher_held = False
+        self._ensure_watcher()
+
+    def _ensure_watcher(self):
+        if self.reload_interval_s <= 0 or self._watcher is not None or self._watcher_held:
+            return
+        with self._lock:
+            if self._watcher is not None or self._watcher_held:
+                return
+            self._watcher = threading.Thread(
+                target=self._watch, args=(self._watcher_stop,), name="crop-registry-watcher", daemon=True,
+            )
+            self._watcher.start()
+
+    def _watch(self, stop: threading.Event):
+        while not stop.wait(self.reload_interval_s):
+            try:
+                self.check_updates()
+            except Exception as e:
+                print(f"⚠️ Error revisando artefactos nuevos: {e}")
+
+    def status(self) -> dict:
+        with self._lock:
+            cultivos = {}
+            for prefix in self.prefixes:
+                crop = self._entries.get(prefix)
+                err = self._errors.get(prefix)
+                cultivos[prefix] = {
+                    "resident": crop is not None,
+                    "version": crop["version"] if crop else None,
+                    "loaded_at": crop["loaded_at"] if crop else None,
+                    "load_seconds": crop["load_seconds"] if crop else None,
+                    "source": crop["source"] if crop else None,
+                    "backend": crop["backend"] if crop else None,
+                    "quantize": crop["quantize"] if crop else None,
+                    "error": err["error"] if err else None,
+                }
+            return {
+                "max_resident": self.max_resident,
+                "reload_interval_s": self.reload_interval_s,
+                "evictions": self._evictions,
+                "reloads": self._reloads,
+                "cultivos": cultivos,
+            }
+
+CROPS = _CropRegistry(CULTIVOS_DISPONIBLES, MAX_RESIDENT_CROPS, RELOAD_INTERVAL_S)
+
+if not any(next(DIR_MODELS.glob(f"{p}_site_student*.pt"), None) for p in CULTIVOS_DISPONIBLES):
+    raise RuntimeError("No se encontró ningún modelo de cultivo")
+
+# Precarga opcional al arrancar ("all" o lista separada por comas)
+for cultivo_prefix in (CULTIVOS_DISPONIBLES if PRELOAD_CROPS == "all" else [p for p in PRELOAD_CROPS.split(",") if p]):
     try:
-        model = MODELOS.get(cultivo_prefix)
-        if model is not None:
-            # StudentMLP tiene net[0] = Linear(in_dim, h1)
-            expected_dim = getattr(model.net[0], 'in_features', None)
+        CROPS.get(cultivo_prefix.strip())
+    except Exception as e:
+        print(f" No se pudo cargar {cultivo_prefix}: {e}")
+
+def _predict_probs_raw(X_raw: np.ndarray, crop: dict) -> np.ndarray:
+    """Probabilidades (N x n_classes) a partir de la matriz cruda, con el backend del cultivo"""
+    t0 = time.perf_counter()
+    probs = crop["engine"](X_raw)
+    _stage_done("forward", crop["prefix"], t0)
+    return probs
+
+def _predict_probs_cached(X_raw: np.ndarray, crop: dict, compute=_predict_probs_raw) -> np.ndarray:
+    """Como compute(X_raw, crop), pero solo calcula las filas que no estén en PREDICT_CACHE"""
+    if PREDICT_CACHE is None:
+        return compute(X_raw, crop)
+    keys = [PREDICT_CACHE.key(crop, x) for x in X_raw]
+    found = PREDICT_CACHE.get_many(crop["prefix"], keys)
+    missing = [i for i, probs in enumerate(found) if probs is None]
+    if missing:
+        computed = compute(X_raw[missing], crop)
+        for i, probs in zip(missing, computed):
+            PREDICT_CACHE.put(keys[i], probs)
+            found[i] = probs
+    return np.stack(found)
+
+def _predict_probs(inps: list[SiteInput], crop: dict) -> np.ndarray:
+    """Probabilidades (N x n_classes) para sitios de un mismo cultivo"""
+    return _predict_probs_cached(_raw_features(inps, crop), crop)
+
+# --- Incertidumbre por MC dropout ---
+# Con mc_samples=K se dejan activas las Dropout del StudentMLP y cada sitio se evalúa K
+# veces con máscaras distintas, todo como una sola matriz de K x N filas. La primera capa
+# no depende de la máscara (el dropout va después de la ReLU), así que se calcula una vez.
+MAX_MC_SAMPLES = int(os.environ.get("ABIO_MAX_MC_SAMPLES", "200"))
+MC_CHUNK_ROWS = 16384  # filas (K x sitios) por bloque, para acotar memoria en lotes grandes
+
+def _mc_dropout_probs(X_raw: np.ndarray, crop: dict, samples: int, rng: np.random.Generator) -> np.ndarray:
+    """Probabilidades (samples x N x n_classes) con dropout activo"""
+    layers = crop.get("run_layers")
+    p = crop.get("mlp_p")
+    if layers is None or len(layers) != 3 or not p:
+        raise RuntimeError(f"el modelo de {crop['prefix']} no admite incertidumbre (sin capas Dropout conocidas)")
+    t0 = time.perf_counter()
+    X = X_raw if crop["fused"] else _model_features(X_raw, crop)
+    (W1, b1), (W2, b2), (W3, b3) = layers
+    keep = np.float32(1.0 - p)
+
+    h1 = X @ W1.T + b1
+    np.maximum(h1, 0, out=h1)
+    n = X.shape[0]
+    out = np.empty((samples, n, W3.shape[0]), dtype=np.float32)
+    step = max(1, MC_CHUNK_ROWS // samples)
+    for start in range(0, n, step):
+        h = h1[start:start + step]
+        m = h.shape[0]
+        # (samples, m, h1) -> (samples*m, h1): una fila por pasada y sitio
+        a = np.broadcast_to(h, (samples,) + h.shape).reshape(samples * m, -1)
+        a = a * (rng.random(a.shape, dtype=np.float32) < keep)
+        a = (a / keep) @ W2.T + b2
+        np.maximum(a, 0, out=a)
+        a *= rng.random(a.shape, dtype=np.float32) < keep
+        a = (a / keep) @ W3.T + b3
+        out[:, start:start + m] = _softmax(a).reshape(samples, m, -1)
+    _stage_done("forward_mc", crop["prefix"], t0)
+    return out
+
+def _mc_uncertainty(probs: np.ndarray, class_names: list) -> tuple[np.ndarray, list[dict]]:
+    """Media por sitio y resumen de dispersión a partir de (samples x N x n_classes)"""
+    mean = probs.mean(axis=0)
+    std = probs.std(axis=0)
+    entropy = np.abs((mean * np.log(np.clip(mean, 1e-12, None))).sum(axis=1))
+    # Fracción de pasadas cuya línea ganadora coincide con la de la media
+    agreement = (probs.argmax(axis=2) == mean.argmax(axis=1)[None, :]).mean(axis=0)
+    summaries = [
+        {
+            "samples": probs.shape[0],
+            "std": {name: float(v) for name, v in zip(class_names, std[i])},
+            "entropy": float(entropy[i]),
+            "max_entropy": float(np.log(len(class_names))),
+            "agreement": float(agreement[i]),
+        }
+        for i in range(mean.shape[0])
+    ]
+    return mean, summaries
+
+def _check_mc_samples(mc_samples: int):
+    if not 0 <= mc_samples <= MAX_MC_SAMPLES:
+        raise HTTPException(status_code=400, detail=f"mc_samples debe estar entre 0 y {MAX_MC_SAMPLES}")
+
+# --- Atribución por campo de entrada ---
+# Gradiente × entrada o gradientes integrados de la probabilidad de la línea predicha,
+# con un backward manual del MLP en NumPy sobre las capas en espacio crudo (scaler
+# fusionado en la primera capa). La referencia es la media del scaler, que es el vector
+# cero en las columnas escaladas del modelo: grad × (x - media) es el gradiente × entrada
+# de esas columnas. Todos los pasos y sitios van en una sola matriz.
+ATTRIBUTION_METHODS = ("grad_input", "integrated_gradients")
+MAX_IG_STEPS = 1024
+ATTRIBUTION_CHUNK_ROWS = 16384  # filas (pasos x sitios) por bloque
+
+def _input_gradients(X: np.ndarray, layers: list, targets: np.ndarray) -> np.ndarray:
+    """Gradiente de la probabilidad de la clase targets[i] respecto de cada fila de X"""
+    (W1, b1), (W2, b2), (W3, b3) = layers
+    z1 = X @ W1.T + b1
+    a1 = np.maximum(z1, 0)
+    z2 = a1 @ W2.T + b2
+    a2 = np.maximum(z2, 0)
+    probs = _softmax(a2 @ W3.T + b3)
+
+    # d p_t / d z3 = p_t * (onehot(t) - p)
+    rows = np.arange(X.shape[0])
+    p_t = probs[rows, targets]
+    g = -p_t[:, None] * probs
+    g[rows, targets] += p_t
+    g = (g @ W3) * (z2 > 0)
+    g = (g @ W2) * (z1 > 0)
+    return g @ W1
+
+def _attributions(X_raw: np.ndarray, crop: dict, targets: np.ndarray, method: str, steps: int) -> list[dict]:
+    """Atribución por campo de SiteInput para cada sitio, hacia la línea targets[i]"""
+    layers = crop["run_layers"] if crop.get("fused") else _fuse_layers(crop.get("layers"), crop)
+    if layers is None or len(layers) != 3:
+        raise RuntimeError(f"el modelo de {crop['prefix']} no admite atribuciones (sin scaler afín o MLP conocido)")
+    t0 = time.perf_counter()
+    baseline = crop["scaler_affine"][0]
+    delta = X_raw - baseline
+    alphas = np.ones(1, dtype=np.float32) if method == "grad_input" else ((np.arange(steps) + 0.5) / steps).astype(np.float32)
+
+    # Integral por punto medio: promedio de los gradientes a lo largo del camino
+    n, k = X_raw.shape[0], len(alphas)
+    grads = np.empty_like(X_raw)
+    chunk = max(1, ATTRIBUTION_CHUNK_ROWS // k)
+    for start in range(0, n, chunk):
+        d = delta[start:start + chunk]
+        m = d.shape[0]
+        points = (baseline + alphas[:, None, None] * d[None]).reshape(k * m, -1)
+        g = _input_gradients(points, layers, np.tile(targets[start:start + m], k))
+        grads[start:start + m] = g.reshape(k, m, -1).mean(axis=0)
+    scores = grads * delta
+
+    forward = _numpy_engine(layers)
+    rows = np.arange(n)
+    p_x = forward(X_raw)[rows, targets]
+    p_base = forward(baseline[None, :])[0, targets]
+
+    plan = crop["feature_plan"]
+    class_names = crop["class_names"]
+    out = []
+    for i in range(n):
+        fields = {
+            key: float(scores[i, plan["field_cols"][key]].sum()) if key in plan["field_cols"] else 0.0
+            for key in FIELD_MAPPING
+        }
+        fields["texturaSuelo"] = float(scores[i, plan["texture_cols"]].sum())
+        if plan["unmapped"]:
+            # Columnas del modelo sin campo en SiteInput (siempre 0 en la entrada)
+            fields["sin_campo"] = float(scores[i, plan["unmapped"]].sum())
+        item = {
+            "method": method,
+            "line": class_names[int(targets[i])],
+            "probability": float(p_x[i]),
+            "baseline_probability": float(p_base[i]),
+            "scores": fields,
+        }
+        if method == "integrated_gradients":
+            # Completitud: la suma debería igualar probability - baseline_probability;
+            # si la diferencia es grande, conviene subir ig_steps
+            item["steps"] = k
+            item["convergence_delta"] = float(scores[i].sum() - (p_x[i] - p_base[i]))
+        out.append(item)
+    _stage_done("attribution", crop["prefix"], t0)
+    return out
+
+def _check_attribution(attribution: Optional[str], ig_steps: int):
+    if attribution is not None and attribution not in ATTRIBUTION_METHODS:
+        raise HTTPException(status_code=400, detail=f"attribution no válida: {attribution}. Opciones: {list(ATTRIBUTION_METHODS)}")
+    if not 1 <= ig_steps <= MAX_IG_STEPS:
+        raise HTTPException(status_code=400, detail=f"ig_steps debe estar entre 1 y {MAX_IG_STEPS}")
+
+def _build_prediction(probs: np.ndarray, class_names: list, gene_panel: dict) -> dict:
+    """Arma la respuesta de /predict a partir del vector de probabilidades de un sitio"""
+    # línea ganadora
+    idx = int(np.argmax(probs))
+    pred_line = class_names[idx]
+    genes = gene_panel.get(pred_line, [])
+
+    used_line = pred_line
+    used_genes = genes
+
+    # fallback: si no hay genes, busca la mejor alternativa CON genes
+    if not genes:
+        for j in np.argsort(probs)[::-1]:  # de mayor a menor prob
+            alt_line = class_names[int(j)]
+            alt_genes = gene_panel.get(alt_line, [])
+            if alt_genes:  # encontramos una con genes
+                used_line = alt_line
+                used_genes = alt_genes
+                break
+
+    return {
+        "predicted_line": pred_line,
+        "probabilities": {name: float(p) for name, p in zip(class_names, probs)},
+        "genes": used_genes,
+        "genes_from_line": used_line  # deja claro de dónde salieron
+    }
+
+def _resolve_cultivo(cultivo_nombre: str) -> dict:
+    """Traduce el nombre amigable del cultivo a su entrada del registro (cargándola si hace falta)"""
+    cultivo_prefix = CULTIVO_MAP.get(cultivo_nombre)
+
+    if not cultivo_prefix:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Cultivo no soportado: {cultivo_nombre}. Disponibles: {list(CULTIVO_MAP.keys())}"
+        )
+
+    try:
+        return CROPS.get(cultivo_prefix)
     except Exception:
-        expected_dim = None
+        raise HTTPException(
+            status_code=400,
+            detail=f"Modelo no disponible para {cultivo_nombre}"
+        )
 
-    if expected_dim is None:
-        expected_dim = config.get('input_dim')
-
-    if expected_dim is not None:
-        cur = int(X.shape[1])
-        if cur < int(expected_dim):
-            pad = int(expected_dim) - cur
-            X = np.hstack([X, np.zeros((1, pad), dtype=np.float32)])
-        elif cur > int(expected_dim):
-            # Si tenemos más features de las que el modelo espera, recortamos al tamaño esperado
-            trim = cur - int(expected_dim)
-            X = X[:, :int(expected_dim)]
-            # Aviso en stdout para depuración ligera
-            print(f"Warning: preprocesador generó {cur} features; recortando {trim} columnas para coincidir con expected {expected_dim}.")
-
-    return torch.tensor(X, dtype=torch.float32)
+# --- Micro-batching dinámico para /predict (opcional) ---
+# Las peticiones concurrentes de un mismo cultivo se encolan y se resuelven en un
+# solo forward pass. Se activa con ABIO_MICROBATCH=1.
+MICROBATCH_ENABLED = os.environ.get("ABIO_MICROBATCH", "0") == "1"
+MICROBATCH_MAX_SIZE = int(os.environ.get("ABIO_MICROBATCH_MAX_SIZE", "64"))
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("ABIO_MICROBATCH_MAX_WAIT_MS", "2"))
+
+class _MicroBatcher:
+    """Cola por cultivo atendida por un hilo que agrupa filas crudas en lotes"""
+
+    def __init__(self, cultivo_prefix: str, max_size: int, max_wait_s: float):
+        self.cultivo_prefix = cultivo_prefix
+        self.max_size = max(1, max_size)
+        self.max_wait_s = max(0.0, max_wait_s)
+        self._cond = threading.Condition()
+        self._pending: list[tuple[np.ndarray, dict, Future]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._batches = 0
+        self._requests = 0
+        self._max_seen = 0
+
+    def submit(self, x_raw: np.ndarray, crop: dict) -> np.ndarray:
+        """Encola una fila cruda y bloquea hasta tener sus probabilidades"""
+        fut: Future = Future()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name=f"microbatch-{self.cultivo_prefix}", daemon=True
+                )
+                self._thread.start()
+            self._pending.append((x_raw, crop, fut))
+            self._cond.notify()
+        return fut.result()
+
+    def _next_batch(self) -> list[tuple[np.ndarray, dict, Future]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # Esperar hasta max_wait por más peticiones, o hasta llenar el lote
+            deadline = time.monotonic() + self.max_wait_s
+            while len(self._pending) < self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = self._pending[:self.max_size]
+            del self._pending[:self.max_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            # Tras un hot reload pueden convivir filas de dos versiones del cultivo
+            por_version: dict[int, list] = {}
+            for item in batch:
+                por_version.setdefault(id(item[1]), []).append(item)
+            for items in por_version.values():
+                try:
+                    probs = _predict_probs_raw(np.stack([x for x, _, _ in items]), items[0][1])
+                except Exception as e:
+                    for _, _, fut in items:
+                        fut.set_exception(e)
+                    continue
+                for row, (_, _, fut) in enumerate(items):
+                    fut.set_result(probs[row])
+            with self._cond:
+                self._batches += 1
+                self._requests += len(batch)
+                self._max_seen = max(self._max_seen, len(batch))
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": (self._requests / self._batches) if self._batches else 0.0,
+                "max_batch_size_seen": self._max_seen,
+            }
+
+_MICROBATCHERS: dict[str, _MicroBatcher] = {}
+_MICROBATCHERS_LOCK = threading.Lock()
+
+def _get_microbatcher(cultivo_prefix: str) -> _MicroBatcher:
+    with _MICROBATCHERS_LOCK:
+        batcher = _MICROBATCHERS.get(cultivo_prefix)
+        if batcher is None:
+            batcher = _MicroBatcher(cultivo_prefix, MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS / 1000.0)
+            _MICROBATCHERS[cultivo_prefix] = batcher
+        return batcher
+
+@app.get("/admission")
+def admission_stats():
+    """Límites, peticiones en curso, en cola y conteos (admitidas, rechazadas, vencidas) por endpoint"""
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "priority": ADMISSION_PRIORITY,
+        "retry_after_s": ADMISSION_RETRY_AFTER_S,
+        "global": _ADMISSION_GLOBAL.stats() if _ADMISSION_GLOBAL is not None else None,
+        "endpoints": {
+            path: {**ADMISSION_LIMITS[path], **gate.stats()} for path, gate in _ADMISSION_GATES.items()
+        },
+    }
 
 @app.get("/")
 def home():
     return {"status": "ok", "msg": "Servidor FastAPI funcionando"}
 
-@app.get("/meta")
-def meta():
+def _meta_payload(cultivo: Optional[str], config: dict) -> dict:
+    if cultivo:
+        # Detalle de un cultivo, incluido el plan de mapeo de features
+        return {
+            "cultivo": cultivo,
+            "prefix": config["prefix"],
+            "version": config["version"],
+            "class_names": config["class_names"],
+            "numeric": config["num_cols"],
+            "categorical": config["cat_cols"],
+            "input_dim": _expected_input_dim(config),
+            "backend": config["backend"],
+            "backend_check": config["backend_check"],
+            "fused": config["fused"],
+            "fuse_check": config["fuse_check"],
+            "quantize": config["quantize"],
+            "quant_check": config["quant_check"],
+            "feature_plan": _describe_feature_plan(config["feature_plan"], config["num_cols"]),
+        }
     return {
         "cultivos": list(CULTIVO_MAP.keys()),
-        "class_names": CLASS_NAMES,
-        "numeric": NUM_COLS,
-        "categorical": CAT_COLS,
+        "class_names": config["class_names"],
+        "numeric": config["num_cols"],
+        "categorical": config["cat_cols"],
     }
 
+@app.get("/meta")
+@_profiled
+def meta(request: Request, cultivo: Optional[str] = None):
+    config = _resolve_cultivo(cultivo) if cultivo else CROPS.get(DEFAULT_CULTIVO)
+    # La respuesta solo cambia con la versión cargada: se serializa una vez por entrada del registro
+    cached = config.setdefault("meta_responses", {})
+    if cultivo not in cached:
+        body = _json_bytes(_meta_payload(cultivo, config))
+        cached[cultivo] = (body, _etag(body))
+    body, etag = cached[cultivo]
+    return _cached_json_response(request, lambda: body, etag, config.get("artifacts_mtime"))
+
+@app.get("/models")
+def models_status():
+    """Estado del registro de cultivos: residentes, versiones y errores de carga"""
+    return CROPS.status()
+
 #Predicción de línea y genes
 
 @app.post("/predict")
-def predict_site(payload: SiteInput):
+@_profiled
+def predict_site(payload: SiteInput, annotate: bool = False, mc_samples: int = 0, mc_seed: Optional[int] = None,
+                 attribution: Optional[str] = None, ig_steps: int = 32):
+    _check_mc_samples(mc_samples)
+    _check_attribution(attribution, ig_steps)
     try:
-        # Determinar cultivo y prefix
-        cultivo_nombre = payload.cultivo
-        cultivo_prefix = CULTIVO_MAP.get(cultivo_nombre)
-        
-        if not cultivo_prefix:
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Cultivo no soportado: {cultivo_nombre}. Disponibles: {list(CULTIVO_MAP.keys())}"
-            )
-        
-        if cultivo_prefix not in CULTIVOS_CONFIG:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Modelo no disponible para {cultivo_nombre}"
-            )
-        
-        # Obtener config y modelo
-        config = CULTIVOS_CONFIG[cultivo_prefix]
-        model = MODELOS[cultivo_prefix]
+        t = time.perf_counter()
+        # Determinar cultivo (una sola versión de artefactos para toda la petición)
+        config = _resolve_cultivo(payload.cultivo)
         class_names = config["class_names"]
         gene_panel = config["gene_panel"]
-        
-        # Preprocesar
-        X = preprocess(payload, cultivo_prefix)
-        
-        # Predecir
-        with torch.no_grad():
-            logits = model(X)
-            probs = torch.softmax(logits, dim=1).numpy()[0]
-
-        # línea ganadora
-        idx = int(np.argmax(probs))
-        pred_line = class_names[idx]
-        genes = gene_panel.get(pred_line, [])
-
-        used_line = pred_line
-        used_genes = genes
-
-        # fallback: si no hay genes, busca la mejor alternativa CON genes
-        if not genes:
-            for j in np.argsort(probs)[::-1]:  # de mayor a menor prob
-                alt_line = class_names[int(j)]
-                alt_genes = gene_panel.get(alt_line, [])
-                if alt_genes:  # encontramos una con genes
-                    used_line = alt_line
-                    used_genes = alt_genes
-                    break
+        prefix = config["prefix"]
+        _set_request_cultivo(prefix)
+        t = _stage_done("resolve", prefix, t)
+
+        X_raw = _raw_features([payload], config)
+        t = _stage_done("preprocess", prefix, t)
+        _check_deadline("inference")
+
+        # Predecir (caché y micro-batching si están activos; mc_samples > 0 no usa ninguno)
+        uncertainty = None
+        if mc_samples:
+            mc = _mc_dropout_probs(X_raw, config, mc_samples, np.random.default_rng(mc_seed))
+            mean, (uncertainty,) = _mc_uncertainty(mc, class_names)
+            probs = mean[0]
+        elif MICROBATCH_ENABLED:
+            batcher = _get_microbatcher(prefix)
+            probs = _predict_probs_cached(X_raw, config, compute=lambda X, crop: batcher.submit(X[0], crop)[None])[0]
+        else:
+            probs = _predict_probs_cached(X_raw, config)[0]
+        t = _stage_done("inference", prefix, t)
+
+        result = _build_prediction(probs, class_names, gene_panel)
+        if uncertainty is not None:
+            result["uncertainty"] = uncertainty
+        # attribution=...: cuánto aportó cada campo a la línea predicha
+        if attribution:
+            targets = np.array([int(np.argmax(probs))])
+            result["attribution"] = _attributions(X_raw, config, targets, attribution, ig_steps)[0]
+        t = _stage_done("build_response", prefix, t)
+        # annotate=true: anotación/GO/KEGG de cada gen en la misma respuesta
+        if annotate:
+            _annotate_prediction(result)
+            _stage_done("annotate", prefix, t)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en predicción: {e}")
 
-        return {
-            "predicted_line": pred_line,
-            "probabilities": {name: float(p) for name, p in zip(class_names, probs)},
-            "genes": used_genes,
-            "genes_from_line": used_line  # deja claro de dónde salieron
-        }
+@app.get("/predict/batching")
+def predict_batching_stats():
+    """Estado del micro-batching: profundidad de cola y tamaño de lote logrado por cultivo"""
+    return {
+        "enabled": MICROBATCH_ENABLED,
+        "max_batch_size": MICROBATCH_MAX_SIZE,
+        "max_wait_ms": MICROBATCH_MAX_WAIT_MS,
+        "cultivos": {prefix: batcher.stats() for prefix, batcher in _MICROBATCHERS.items()},
+    }
+
+@app.get("/predict/cache")
+def predict_cache_stats():
+    """Aciertos y fallos de la caché de predicciones, en total y por cultivo"""
+    if PREDICT_CACHE is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "max_size": PREDICT_CACHE.max_size,
+        "decimals": PREDICT_CACHE.decimals,
+        **PREDICT_CACHE.stats(),
+    }
+
+# --- Predicción por lotes ---
+MAX_BATCH_SITES = 5000
+
+class BatchInput(BaseModel):
+    sites: list[SiteInput]
+
+@app.post("/predict/batch")
+@_profiled
+def predict_batch(payload: BatchInput, annotate: bool = False, mc_samples: int = 0, mc_seed: Optional[int] = None,
+                  attribution: Optional[str] = None, ig_steps: int = 32):
+    """Predice muchos sitios (de uno o varios cultivos) con un forward pass por cultivo"""
+    _check_mc_samples(mc_samples)
+    _check_attribution(attribution, ig_steps)
+    sites = payload.sites
+    if not sites:
+        raise HTTPException(status_code=400, detail="La lista 'sites' está vacía")
+    if len(sites) > MAX_BATCH_SITES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Demasiados sitios en el lote: {len(sites)} (máximo {MAX_BATCH_SITES})"
+        )
+
+    # Agrupar índices por cultivo_prefix conservando el orden original
+    crops: dict[str, dict] = {}
+    grupos: dict[str, list[int]] = {}
+    for i, site in enumerate(sites):
+        if site.cultivo not in crops:
+            try:
+                crops[site.cultivo] = _resolve_cultivo(site.cultivo)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"sites[{i}]: {e.detail}")
+        grupos.setdefault(crops[site.cultivo]["prefix"], []).append(i)
+    crop_by_prefix = {crop["prefix"]: crop for crop in crops.values()}
+    _set_request_cultivo(next(iter(grupos)) if len(grupos) == 1 else "varios")
+
+    results: list[Optional[dict]] = [None] * len(sites)
+    memo: dict = {}
+    rng = np.random.default_rng(mc_seed)
+    try:
+        for cultivo_prefix, idxs in grupos.items():
+            _check_deadline(f"predecir {cultivo_prefix}")
+            config = crop_by_prefix[cultivo_prefix]
+            class_names = config["class_names"]
+            gene_panel = config["gene_panel"]
+
+            X_raw = _raw_features([sites[i] for i in idxs], config)
+            if mc_samples:
+                probs, uncertainty = _mc_uncertainty(_mc_dropout_probs(X_raw, config, mc_samples, rng), class_names)
+            else:
+                probs = _predict_probs_cached(X_raw, config)
+            if attribution:
+                attributions = _attributions(X_raw, config, probs.argmax(axis=1), attribution, ig_steps)
+
+            for row, i in enumerate(idxs):
+                results[i] = _build_prediction(probs[row], class_names, gene_panel)
+                if mc_samples:
+                    results[i]["uncertainty"] = uncertainty[row]
+                if attribution:
+                    results[i]["attribution"] = attributions[row]
+                if annotate:
+                    _annotate_prediction(results[i], memo)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error en predicción: {e}")
 
+    return {
+        "results": results,
+        "total": len(results),
+    }
+
+
+# --- Barrido "what-if" sobre una grilla de parámetros ambientales ---
+MAX_SWEEP_CELLS = 40000  # p. ej. 200 x 200
+SWEEP_FIELDS = list(FIELD_MAPPING.keys())
+
+class SweepAxis(BaseModel):
+    param: str  # campo numérico de SiteInput, p. ej. "temperatura" o "nacl"
+    start: float
+    stop: float
+    steps: int = Field(50, ge=1, le=MAX_SWEEP_CELLS)  # acotado aquí: el producto de los ejes se calcula después
+
+class SweepInput(BaseModel):
+    site: SiteInput  # sitio base; los parámetros barridos reemplazan sus valores
+    axes: list[SweepAxis]  # 1 o 2 ejes
+    cultivos: Optional[list[str]] = None  # por defecto solo site.cultivo
+    decimals: int = 4  # redondeo de las probabilidades en la respuesta
+
+def _sweep_crop(site: SiteInput, axes: list[SweepAxis], values: list[np.ndarray], crop: dict, decimals: int) -> dict:
+    """Arma toda la grilla como una sola matriz y la pasa por el modelo en un forward pass"""
+    shape = tuple(len(v) for v in values)
+    n = int(np.prod(shape))
+    plan = crop["feature_plan"]
+
+    columns = {key: np.full(n, getattr(site, key), dtype=np.float32) for key in plan["field_cols"]}
+    # indexing="ij": la celda (i, j) usa values[0][i] y values[1][j]
+    for axis, grid in zip(axes, np.meshgrid(*values, indexing="ij")):
+        if axis.param in columns:
+            columns[axis.param] = grid.ravel().astype(np.float32)
+    X_raw = _raw_features_from_columns(columns, [site.texturaSuelo] * n, n, crop)
+
+    probs = _predict_probs_raw(X_raw, crop)
+    return {
+        "prefix": crop["prefix"],
+        "version": crop["version"],
+        "class_names": crop["class_names"],
+        # Parámetros que este modelo no usa: la grilla no cambia a lo largo de ese eje
+        "sin_efecto": [a.param for a in axes if a.param not in plan["field_cols"]],
+        "winner": probs.argmax(axis=1).reshape(shape).tolist(),
+        "probabilities": np.round(probs, decimals).reshape(shape + (probs.shape[1],)).tolist(),
+    }
+
+@app.post("/predict/sweep")
+@_profiled
+def predict_sweep(payload: SweepInput):
+    """Predicción sobre una grilla de 1 o 2 parámetros alrededor de un sitio base.
+
+    Devuelve por cultivo la matriz de clases ganadoras (índices en class_names) y las
+    probabilidades por celda, con un forward pass por cultivo para toda la grilla.
+    """
+    axes = payload.axes
+    if not 1 <= len(axes) <= 2:
+        raise HTTPException(status_code=400, detail="axes debe tener 1 o 2 parámetros")
+    params = [a.param for a in axes]
+    invalid = [p for p in params if p not in SWEEP_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Parámetros no válidos: {invalid}. Disponibles: {SWEEP_FIELDS}")
+    if len(set(params)) != len(params):
+        raise HTTPException(status_code=400, detail="Los parámetros de axes deben ser distintos")
+    cells = math.prod(a.steps for a in axes)  # enteros de Python: sin desbordamiento de int64
+    if cells > MAX_SWEEP_CELLS:
+        raise HTTPException(status_code=413, detail=f"Grilla demasiado grande: {cells} celdas (máximo {MAX_SWEEP_CELLS})")
+
+    values = [np.linspace(a.start, a.stop, a.steps) for a in axes]
+    nombres = payload.cultivos or [payload.site.cultivo]
+    crops = {nombre: _resolve_cultivo(nombre) for nombre in nombres}
+    _set_request_cultivo(crops[nombres[0]]["prefix"] if len(crops) == 1 else "varios")
+
+    try:
+        resultados = {
+            nombre: _sweep_crop(payload.site, axes, values, crop, max(0, payload.decimals))
+            for nombre, crop in crops.items()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error en el barrido: {e}")
+
+    # Respuesta ya serializable: JSONResponse evita el recorrido de jsonable_encoder
+    return JSONResponse({
+        "params": params,
+        "values": [v.tolist() for v in values],
+        "shape": [len(v) for v in values],
+        "cultivos": resultados,
+    })
+
+# --- Mejor cultivo para un sitio ("best fit") ---
+# El mismo sitio pasa por el modelo de cada cultivo, con el preprocesamiento de ese
+# cultivo, y los cultivos se ordenan por la probabilidad de su línea ganadora. Cada
+# cultivo se evalúa en un hilo del pool (incluida su carga si no estaba residente),
+# así que la latencia total es la del cultivo más lento y no la suma.
+BEST_FIT_WORKERS = int(os.environ.get("ABIO_BEST_FIT_WORKERS", str(len(CULTIVO_MAP))))
+_BEST_FIT_POOL: Optional[ThreadPoolExecutor] = None
+_BEST_FIT_LOCK = threading.Lock()
+
+class BestFitInput(SiteInput):
+    cultivo: Optional[str] = None  # no se usa: se evalúan todos los cultivos
+    cultivos: Optional[list[str]] = None  # por defecto todos los de CULTIVO_MAP
+    top_k: int = 3  # líneas por cultivo en la respuesta
+
+def _best_fit_pool() -> Optional[ThreadPoolExecutor]:
+    """Pool compartido de /predict/best (None con ABIO_BEST_FIT_WORKERS <= 1)"""
+    global _BEST_FIT_POOL
+    if BEST_FIT_WORKERS <= 1:
+        return None
+    with _BEST_FIT_LOCK:
+        if _BEST_FIT_POOL is None:
+            _BEST_FIT_POOL = ThreadPoolExecutor(BEST_FIT_WORKERS, thread_name_prefix="best-fit")
+        return _BEST_FIT_POOL
+
+def _best_fit_crop(site: SiteInput, nombre: str, top_k: int) -> dict:
+    """Predicción de un cultivo para /predict/best, con sus top_k líneas y paneles de genes"""
+    crop = _resolve_cultivo(nombre)
+    prefix = crop["prefix"]
+    class_names = crop["class_names"]
+    gene_panel = crop["gene_panel"]
+
+    t = time.perf_counter()
+    X_raw = _raw_features([site], crop)
+    t = _stage_done("preprocess", prefix, t)
+    probs = _predict_probs_cached(X_raw, crop)[0]
+    _stage_done("inference", prefix, t)
+
+    result = _build_prediction(probs, class_names, gene_panel)
+    top = np.argsort(probs)[::-1][:top_k]
+    return {
+        "cultivo": nombre,
+        "prefix": prefix,
+        "version": crop["version"],
+        "predicted_line": result["predicted_line"],
+        "probability": float(probs[top[0]]),
+        "n_lines": len(class_names),
+        "top_lines": [
+            {"line": class_names[j], "probability": float(probs[j]), "genes": gene_panel.get(class_names[j], [])}
+            for j in top
+        ],
+        "genes": result["genes"],
+        "genes_from_line": result["genes_from_line"],
+    }
+
+@app.post("/predict/best")
+@_profiled
+def predict_best(payload: BestFitInput, annotate: bool = False):
+    """Evalúa un sitio con todos los cultivos y los devuelve ordenados de mejor a peor.
+
+    Cada modelo es independiente: la probabilidad de un cultivo con pocas líneas tiende a
+    ser mayor que la de uno con muchas (ver n_lines). Los cultivos que no se pueden cargar
+    aparecen en "errores" sin hacer fallar la petición.
+    """
+    nombres = list(dict.fromkeys(payload.cultivos or CULTIVO_MAP))
+    invalid = [n for n in nombres if n not in CULTIVO_MAP]
+    if invalid:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cultivos no soportados: {invalid}. Disponibles: {list(CULTIVO_MAP.keys())}"
+        )
+    if payload.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k debe ser >= 1")
+    _set_request_cultivo(CULTIVO_MAP[nombres[0]] if len(nombres) == 1 else "varios")
+
+    # Al perfilar se evalúa en este mismo hilo para que cProfile vea todo el trabajo
+    pool = _best_fit_pool() if len(nombres) > 1 and _PROFILE_REQUEST.get() is None else None
+    futures = {n: pool.submit(_best_fit_crop, payload, n, payload.top_k) for n in nombres} if pool else {}
+    ranking: list[dict] = []
+    errores: dict[str, str] = {}
+    for nombre in nombres:
+        try:
+            ranking.append(futures[nombre].result() if pool else _best_fit_crop(payload, nombre, payload.top_k))
+        except HTTPException as e:
+            errores[nombre] = e.detail
+        except Exception as e:
+            errores[nombre] = f"Error en predicción: {e}"
+    if not ranking:
+        raise HTTPException(status_code=400, detail=f"Ningún cultivo pudo evaluarse: {errores}")
+
+    ranking.sort(key=lambda r: r["probability"], reverse=True)
+    if annotate:
+        memo: dict = {}
+        for result in ranking:
+            _annotate_prediction(result, memo)
+    # Los paneles de genes pesan: JSONResponse evita el recorrido de jsonable_encoder
+    return JSONResponse({"ranking": ranking, "errores": errores})
+
+# --- Predicción masiva desde archivo (CSV / NDJSON) con respuesta en streaming ---
+UPLOAD_CHUNK_ROWS = 2000
+SITE_COLUMNS = ["cultivo", "texturaSuelo"] + list(FIELD_MAPPING.keys())
+UPLOAD_CSV_COLUMNS = ["row", "cultivo", "predicted_line", "probability", "genes_from_line", "genes", "error"]
+
+def _detect_upload_format(file: UploadFile) -> Optional[str]:
+    name = (file.filename or "").lower()
+    content_type = (file.content_type or "").lower()
+    if name.endswith(".csv") or "csv" in content_type:
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl", ".json")) or "json" in content_type:
+        return "ndjson"
+    return None
+
+def _iter_upload_chunks(file: UploadFile, fmt: str):
+    """Lee el archivo subido en bloques de UPLOAD_CHUNK_ROWS filas (DataFrames)"""
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        return pd.read_csv(text, chunksize=UPLOAD_CHUNK_ROWS, dtype=str, keep_default_na=False)
+    return pd.read_json(text, lines=True, chunksize=UPLOAD_CHUNK_ROWS, dtype=False)
+
+def _predict_chunk(df: pd.DataFrame, start: int, memo: Optional[dict] = None) -> list[dict]:
+    """Predice un bloque del archivo agrupando por cultivo; devuelve un resultado por fila"""
+    n = len(df)
+    results: list[Optional[dict]] = [None] * n
+    nums = {k: pd.to_numeric(df[k], errors="coerce").to_numpy(dtype=np.float64) for k in FIELD_MAPPING}
+    texturas = df["texturaSuelo"].fillna("").astype(str).to_numpy()
+    cultivos = df["cultivo"].fillna("").astype(str).str.strip().to_numpy()
+
+    # Resolver cada cultivo distinto una sola vez por bloque
+    crops: dict[str, object] = {}
+    for name in set(cultivos):
+        try:
+            crops[name] = _resolve_cultivo(name)
+        except HTTPException as e:
+            crops[name] = e.detail
+
+    grupos: dict[str, list[int]] = {}
+    for i in range(n):
+        bad = [k for k, vals in nums.items() if not np.isfinite(vals[i])]
+        crop = crops[cultivos[i]]
+        if bad:
+            results[i] = {"row": start + i, "cultivo": cultivos[i], "error": f"Valores numéricos inválidos en: {', '.join(bad)}"}
+        elif not isinstance(crop, dict):
+            results[i] = {"row": start + i, "cultivo": cultivos[i], "error": crop}
+        else:
+            grupos.setdefault(cultivos[i], []).append(i)
+
+    for name, idxs in grupos.items():
+        config = crops[name]
+        sel = np.asarray(idxs)
+        X_raw = _raw_features_from_columns(
+            {k: vals[sel] for k, vals in nums.items()}, texturas[sel], len(idxs), config
+        )
+        # Sin caché: un archivo grande la llenaría de filas que no se vuelven a pedir
+        probs = _predict_probs_raw(X_raw, config)
+        for row, i in enumerate(idxs):
+            pred = _build_prediction(probs[row], config["class_names"], config["gene_panel"])
+            if memo is not None:
+                _annotate_prediction(pred, memo)
+            results[i] = {"row": start + i, "cultivo": cultivos[i], **pred}
+    return results
+
+def _format_upload_results(results: list[dict], output: str, header: bool) -> str:
+    if output == "ndjson":
+        return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+
+    # CSV: una fila por sitio; los genes se unen con ';'
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header:
+        writer.writerow(UPLOAD_CSV_COLUMNS)
+    for r in results:
+        if "error" in r:
+            writer.writerow([r["row"], r["cultivo"], "", "", "", "", r["error"]])
+            continue
+        genes = ";".join(g.get("gene", "") if isinstance(g, dict) else str(g) for g in r["genes"])
+        writer.writerow([
+            r["row"], r["cultivo"], r["predicted_line"], r["probabilities"][r["predicted_line"]],
+            r["genes_from_line"], genes, "",
+        ])
+    return buf.getvalue()
+
+@app.post("/predict/upload")
+def predict_upload(file: UploadFile = File(...), output: str = "ndjson", annotate: bool = False):
+    """Predice todas las filas de un CSV/NDJSON con columnas de SiteInput, respondiendo en streaming.
+
+    El archivo se procesa en bloques de UPLOAD_CHUNK_ROWS filas, así que la memoria no
+    depende del tamaño del archivo y los primeros resultados salen antes de terminar.
+    """
+    if output not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="output debe ser 'ndjson' o 'csv'")
+    if annotate and output != "ndjson":
+        raise HTTPException(status_code=400, detail="annotate solo está disponible con output=ndjson")
+    fmt = _detect_upload_format(file)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Formato no soportado: sube un .csv o .ndjson")
+
+    try:
+        chunks = _iter_upload_chunks(file, fmt)
+        first = next(iter(chunks), None)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"No pude leer el archivo: {e}")
+    if first is None or len(first) == 0:
+        raise HTTPException(status_code=400, detail="El archivo no contiene filas")
+    missing = [c for c in SITE_COLUMNS if c not in first.columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Faltan columnas en el archivo: {missing}")
+
+    def generate():
+        start = 0
+        memo = {} if annotate else None
+        try:
+            for chunk in itertools.chain([first], chunks):
+                results = _predict_chunk(chunk, start, memo)
+                yield _format_upload_results(results, output, header=(start == 0))
+                start += len(chunk)
+        except Exception as e:
+            # Ya se enviaron resultados: el error viaja como última línea
+            err = {"row": start, "cultivo": "", "error": f"Error procesando el archivo: {e}"}
+            yield _format_upload_results([err], output, header=(start == 0))
+        finally:
+            file.file.close()
+
+    media_type = "application/x-ndjson" if output == "ndjson" else "text/csv"
+    return StreamingResponse(generate(), media_type=media_type)
+
 
 # -----------------------------
 # Endpoint para Interpretaciones (Excel estático en servidor)
@@ -533,33 +2781,333 @@ def _build_interpretation_files() -> dict[str, Path]:
 
     return files
 
-@app.get('/interpretation/rows')
-def get_interpretation_rows(cultivo: Optional[str] = None, q: Optional[str] = None, field: str = 'id'):
-    """Sirve filas del Excel de interpretaciones filtradas por cultivo y búsqueda"""
+def normalize_col_name(name: str) -> str:
+    text = str(name).strip().lower()
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = ''.join(ch for ch in text if ch.isalnum())
+    return text
+
+# Candidatos aceptados para cada columna normalizada de las tablas
+INTERPRETATION_COLUMNS = {
+    'id': ['id', 'id del gen', 'gene', 'gene id', 'gene_id', 'gene input', 'gene_input'],
+    'anotation': [
+        'anotation', 'annotation', 'anotacion', 'anotación',
+        'function', 'funcion', 'función', 'protein name', 'protein_name', 'nombre'
+    ],
+    'go': ['go', 'go terms', 'go term', 'go_term', 'go_terms', 'gene ontology'],
+    'kegg': ['kegg', 'kegg pathway', 'pathway', 'pathways', 'pathway name', 'pathway_name'],
+}
+INTERPRETATION_FIELDS = list(INTERPRETATION_COLUMNS.keys())
+
+def find_col(columns, cands) -> Optional[str]:
+    """Primera columna de `columns` cuyo nombre normalizado coincide con algún candidato"""
+    cols_map = {normalize_col_name(str(c)): c for c in columns}
+    for cand in cands:
+        k = normalize_col_name(cand)
+        if k in cols_map:
+            return cols_map[k]
+    return None
+
+def _text_column(series: pd.Series) -> np.ndarray:
+    """Columna como arreglo de str limpios ('' para celdas vacías)"""
+    return np.where(series.notna(), series.astype(str).str.strip(), '').astype(object)
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def _build_search_index(values: np.ndarray) -> dict:
+    """Índice de trigramas (en minúsculas) de una columna: trigrama → filas que lo contienen"""
+    lower = np.array([v.lower() for v in values], dtype=object)
+    postings: dict[str, list[int]] = {}
+    for i, text in enumerate(lower):
+        for tri in _trigrams(text):
+            postings.setdefault(tri, []).append(i)
+    return {
+        "lower": lower,
+        "trigrams": {tri: np.array(rows, dtype=np.int32) for tri, rows in postings.items()},
+    }
 
-    def normalize_col_name(name: str) -> str:
-        text = str(name).strip().lower()
-        text = unicodedata.normalize('NFKD', text)
-        text = ''.join(ch for ch in text if not unicodedata.combining(ch))
-        text = ''.join(ch for ch in text if ch.isalnum())
-        return text
+def _search_index(index: dict, ql: str) -> np.ndarray:
+    """Filas (en orden) cuyo valor en minúsculas contiene `ql` como subcadena"""
+    lower = index["lower"]
+    if len(ql) < 3:
+        # Consultas muy cortas: recorrido directo sobre la columna ya en minúsculas
+        return np.array([i for i, text in enumerate(lower) if ql in text], dtype=np.int32)
+
+    # Intersección de postings, empezando por el trigrama más raro
+    postings = []
+    for tri in _trigrams(ql):
+        rows = index["trigrams"].get(tri)
+        if rows is None:
+            return np.zeros(0, dtype=np.int32)
+        postings.append(rows)
+    postings.sort(key=len)
+    cands = postings[0]
+    for rows in postings[1:]:
+        if len(cands) == 0:
+            break
+        cands = np.intersect1d(cands, rows, assume_unique=True)
+
+    # Los trigramas solo filtran: confirmar la subcadena completa
+    return np.array([i for i in cands if ql in lower[i]], dtype=np.int32)
+
+def _excel_table_columns(file_path: Path) -> Optional[dict[str, np.ndarray]]:
+    """Columnas id/anotation/go/kegg de un workbook ya normalizadas; None si le falta alguna"""
+    t = time.perf_counter()
+    df = pd.read_excel(file_path)
+    _stage_done("parse_excel", file_path.stem, t)
+    found = {field: find_col(df.columns, cands) for field, cands in INTERPRETATION_COLUMNS.items()}
+    if any(col is None for col in found.values()):
+        return None
+    return {field: _text_column(df[col]) for field, col in found.items()}
+
+# --- Tablas convertidas (python convert_tables.py) ---
+# Las mismas columnas que _excel_table_columns, guardadas con el formato de los bundles:
+# por columna, el texto UTF-8 concatenado y los offsets (en caracteres) de cada fila.
+# Se leen con np.memmap en lugar de abrir el .xlsx con pandas/openpyxl.
+TABLES_DIR = Path(os.environ.get("ABIO_TABLES_DIR", BASE / "tables"))
+USE_CONVERTED_TABLES = os.environ.get("ABIO_USE_CONVERTED_TABLES", "1") == "1"
+TABLE_MAGIC = b"ABIOTABL"
+TABLE_FORMAT = 1
+
+def converted_table_path(source: Path, out_dir: Path = TABLES_DIR) -> Path:
+    """Archivo convertido de un workbook (el hash evita choques entre db/ y backend/db)"""
+    tag = hashlib.sha1(str(Path(source).resolve()).encode("utf-8")).hexdigest()[:8]
+    return Path(out_dir) / f"{Path(source).stem}_{tag}.tbl"
+
+def write_converted_table(source: Path, out_dir: Path = TABLES_DIR) -> tuple[Path, Optional[int]]:
+    """Convierte un workbook; devuelve la ruta y el número de filas (None si le faltan columnas)"""
+    source = Path(source)
+    columns = _excel_table_columns(source)
+    arrays = {}
+    for field, values in (columns or {}).items():
+        text = "".join(values)
+        offsets = np.zeros(len(values) + 1, dtype=np.int64)
+        np.cumsum([len(v) for v in values], out=offsets[1:])
+        arrays[f"{field}.text"] = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        arrays[f"{field}.offsets"] = offsets
+    st = source.stat()
+    header = {
+        "format": TABLE_FORMAT,
+        "built_at": time.time(),
+        "source": [source.name, st.st_size, st.st_mtime_ns],
+        # Sin columnas: el workbook no es una tabla de interpretación y se recuerda igual
+        "fields": list(columns) if columns is not None else None,
+        "n": len(next(iter(columns.values()))) if columns else 0,
+    }
+    out_path = converted_table_path(source, out_dir)
+    _write_aligned_file(out_path, TABLE_MAGIC, header, arrays)
+    return out_path, (header["n"] if columns is not None else None)
+
+def _read_converted_table(path: Path) -> Optional[dict[str, np.ndarray]]:
+    """Columnas de un archivo de write_converted_table; None si el workbook no tenía las columnas"""
+    header, arrays = _read_aligned_file(path, TABLE_MAGIC)
+    if header.get("format") != TABLE_FORMAT:
+        raise RuntimeError(f"{path.name}: formato de tabla {header.get('format')} no soportado")
+    if header["fields"] is None:
+        return None
+    columns = {}
+    for field in header["fields"]:
+        text = arrays[f"{field}.text"].tobytes().decode("utf-8")
+        offsets = arrays[f"{field}.offsets"].tolist()
+        values = np.empty(header["n"], dtype=object)
+        values[:] = [text[a:b] for a, b in zip(offsets, offsets[1:])]
+        columns[field] = values
+    return columns
+
+def _table_columns(file_path: Path) -> Optional[dict[str, np.ndarray]]:
+    """Columnas de la versión convertida si es más nueva que el workbook; si no, del Excel"""
+    converted = converted_table_path(file_path)
+    if USE_CONVERTED_TABLES:
+        conv_stamp, src_stamp = _file_stamp(converted), _file_stamp(file_path)
+        if conv_stamp is not None and src_stamp is not None and conv_stamp[0] >= src_stamp[0]:
+            t = time.perf_counter()
+            try:
+                columns = _read_converted_table(converted)
+                _stage_done("read_converted", file_path.stem, t)
+                return columns
+            except Exception as e:
+                print(f"⚠️ Tabla convertida {converted.name} inválida ({e}); se lee el Excel")
+    return _excel_table_columns(file_path)
+
+def _parse_interpretation_table(file_path: Path) -> Optional[dict]:
+    """Lee un workbook y lo deja como arreglos columnares indexados; None si le faltan columnas"""
+    columns = _table_columns(file_path)
+    if columns is None:
+        return None
+    t = time.perf_counter()
+    search = {field: _build_search_index(values) for field, values in columns.items()}
+    _stage_done("build_index", file_path.stem, t)
+    return {
+        "n": len(columns["id"]),
+        "columns": columns,
+        "search": search,
+    }
+
+# --- Store en memoria de tablas de interpretación ---
+# Cada workbook se parsea una sola vez y se vuelve a leer únicamente si cambia su
+# mtime o tamaño. El listado de archivos se re-descubre cuando cambia alguna carpeta.
+_INTERP_LOCK = threading.Lock()
+_INTERP_TABLES: dict[Path, dict] = {}
+_INTERP_FILES: dict = {"stamp": None, "files": {}}
+
+def _file_stamp(path: Path) -> Optional[tuple]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _interpretation_files() -> dict[str, Path]:
+    """_build_interpretation_files() cacheado según el mtime de backend/db y db/"""
+    stamp = tuple(_file_stamp(d) for d in (DB_DIR, ROOT_DB_DIR))
+    with _INTERP_LOCK:
+        if _INTERP_FILES["stamp"] != stamp:
+            files = _build_interpretation_files()
+            _INTERP_FILES["stamp"] = stamp
+            _INTERP_FILES["files"] = files
+            # Olvidar tablas de archivos que ya no existen
+            for path in list(_INTERP_TABLES):
+                if path not in files.values():
+                    del _INTERP_TABLES[path]
+        return _INTERP_FILES["files"]
+
+def _get_interpretation_table(file_path: Path) -> Optional[dict]:
+    """Tabla columnar de un workbook, re-parseada solo si el archivo cambió"""
+    stamp = _file_stamp(file_path)
+    with _INTERP_LOCK:
+        entry = _INTERP_TABLES.get(file_path)
+        if entry is not None and entry["stamp"] == stamp:
+            return entry["table"]
+    table = _parse_interpretation_table(file_path)
+    with _INTERP_LOCK:
+        _INTERP_TABLES[file_path] = {"stamp": stamp, "table": table}
+    return table
+
+# --- Anotaciones por gen (para enriquecer las predicciones) ---
+# Los paneles y las tablas escriben los ids distinto: "gene:Solyc12g044890.2" vs "Solyc12g044890.3.2"
+GENE_ID_PREFIXES = ("gene:", "transcript:", "mrna:", "cds:")
+_GENE_VERSION_RE = re.compile(r"(\.\d+)+$")
+_GENE_INDEX: dict = {"stamp": None, "exact": {}, "base": {}}
+
+def _gene_key(gene_id) -> str:
+    """Id de gen normalizado: minúsculas, sin espacios ni prefijos tipo "gene:" """
+    text = str(gene_id).strip().lower()
+    for prefix in GENE_ID_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    return text
+
+def _gene_base_key(key: str) -> str:
+    """Id normalizado sin sufijos de versión/transcrito (".3.2")"""
+    return _GENE_VERSION_RE.sub("", key)
 
-    interpretation_files = _build_interpretation_files()
+def _gene_annotation_index() -> dict:
+    """Índice id de gen → anotación sobre todas las tablas de interpretación.
+
+    Se reconstruye solo cuando cambia algún workbook. Si un id aparece en varias tablas
+    gana la primera; "base" permite encontrar el gen aunque difiera la versión.
+    """
+    files = _interpretation_files()
+    stamp = tuple((label, _file_stamp(path)) for label, path in files.items())
+    with _INTERP_LOCK:
+        if _GENE_INDEX["stamp"] == stamp:
+            return _GENE_INDEX
+    exact: dict[str, dict] = {}
+    base: dict[str, dict] = {}
+    for label, path in files.items():
+        table = _get_interpretation_table(path)
+        if table is None:
+            continue
+        cols = table["columns"]
+        for i, gene_id in enumerate(cols["id"]):
+            if not gene_id:
+                continue
+            key = _gene_key(gene_id)
+            if key in exact:
+                continue
+            entry = {
+                "cultivo": label,
+                "id": gene_id,
+                "anotation": cols["anotation"][i],
+                "go": cols["go"][i],
+                "kegg": cols["kegg"][i],
+            }
+            exact[key] = entry
+            base.setdefault(_gene_base_key(key), entry)
+    with _INTERP_LOCK:
+        _GENE_INDEX.update(stamp=stamp, exact=exact, base=base)
+        return _GENE_INDEX
+
+def _gene_annotations(genes: list) -> dict[str, Optional[dict]]:
+    """Anotación (o None) de cada gen de un panel, con el id tal como viene en el panel"""
+    index = _gene_annotation_index()
+    out: dict[str, Optional[dict]] = {}
+    for g in genes:
+        gene_id = g.get("gene", "") if isinstance(g, dict) else str(g)
+        if not gene_id or gene_id in out:
+            continue
+        key = _gene_key(gene_id)
+        out[gene_id] = index["exact"].get(key) or index["base"].get(_gene_base_key(key))
+    return out
+
+def _annotate_prediction(result: dict, memo: Optional[dict] = None) -> dict:
+    """Agrega "annotations" (anotación/GO/KEGG por gen) a una respuesta de predicción.
+
+    `memo` reutiliza el resultado entre sitios que devuelven el mismo panel de genes.
+    """
+    genes = result.get("genes")
+    if genes is None:
+        return result
+    if memo is None:
+        result["annotations"] = _gene_annotations(genes)
+    else:
+        if id(genes) not in memo:
+            memo[id(genes)] = _gene_annotations(genes)
+        result["annotations"] = memo[id(genes)]
+    return result
+
+INTERPRETATION_LAYOUTS = ('rows', 'columns')
+
+@app.get('/interpretation/rows')
+@_profiled
+def get_interpretation_rows(request: Request, cultivo: Optional[str] = None, q: Optional[str] = None,
+                            field: str = 'id', limit: Optional[int] = None, offset: int = 0,
+                            layout: str = 'rows'):
+    """Sirve filas del Excel de interpretaciones filtradas por cultivo y búsqueda.
+
+    `limit`/`offset` paginan el resultado; `total` siempre es el número de coincidencias.
+    `layout=columns` devuelve arreglos paralelos por campo en lugar de una lista de dicts.
+    La respuesta lleva ETag/Last-Modified según los workbooks leídos (304 si no cambiaron).
+    """
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail='limit y offset deben ser >= 0')
+    if layout not in INTERPRETATION_LAYOUTS:
+        raise HTTPException(status_code=400, detail="layout debe ser 'rows' o 'columns'")
+
+    t = time.perf_counter()
+    interpretation_files = _interpretation_files()
     selected_specific = bool(cultivo and cultivo != 'Todos')
+    selected_label = None
+    if selected_specific:
+        for label in interpretation_files.keys():
+            if label.lower() == cultivo.lower():
+                selected_label = label
+                break
+    # La etiqueta de las métricas sale del conjunto conocido, nunca del texto del cliente
+    stage_label = (selected_label or 'otro') if selected_specific else 'Todos'
+    _set_request_cultivo(stage_label)
+    t = _stage_done('interp_files', stage_label, t)
 
     if not interpretation_files:
         raise HTTPException(status_code=404, detail='No se encontraron archivos de interpretaciones')
     
     # Determinar qué archivos leer
     files_to_read = []
-    if cultivo and cultivo != 'Todos':
+    if selected_specific:
         # Leer solo el archivo del cultivo especificado
-        selected_label = None
-        for label in interpretation_files.keys():
-            if label.lower() == cultivo.lower():
-                selected_label = label
-                break
-
         if selected_label is None:
             raise HTTPException(status_code=404, detail=f'Archivo de interpretaciones para {cultivo} no encontrado')
 
@@ -577,76 +3125,220 @@ def get_interpretation_rows(cultivo: Optional[str] = None, q: Optional[str] = No
     if not files_to_read:
         raise HTTPException(status_code=404, detail='No se encontraron archivos de interpretaciones')
 
+    # Validadores: mismos workbooks (mtime/tamaño) y mismos parámetros → misma respuesta
+    stamps = [(cult, _file_stamp(file_path)) for cult, file_path in files_to_read]
+    etag = _etag(list(interpretation_files), stamps, cultivo, q, field, limit, offset, layout)
+    last_modified = max((stamp[0] / 1e9 for _, stamp in stamps if stamp), default=None)  # mtime_ns → s
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+
     try:
-        # Leer y combinar todos los archivos necesarios
-        all_rows = []
-        loaded_cultivos = set()
+        # Tablas ya parseadas e indexadas (desde el store en memoria)
+        tables = []
         for cult, file_path in files_to_read:
-            df = pd.read_excel(file_path)
-            # normalizar nombres de columnas
-            cols_map = {normalize_col_name(str(c)): c for c in df.columns}
-            def find_col(cands):
-                for cand in cands:
-                    k = normalize_col_name(cand)
-                    if k in cols_map:
-                        return cols_map[k]
-                return None
-
-            colID = find_col([
-                'id', 'id del gen', 'gene', 'gene id', 'gene_id', 'gene input', 'gene_input'
-            ])
-            colAnnotation = find_col([
-                'anotation', 'annotation', 'anotacion', 'anotación',
-                'function', 'funcion', 'función', 'protein name', 'protein_name', 'nombre'
-            ])
-            colGO = find_col([
-                'go', 'go terms', 'go term', 'go_term', 'go_terms', 'gene ontology'
-            ])
-            colKEGG = find_col([
-                'kegg', 'kegg pathway', 'pathway', 'pathways', 'pathway name', 'pathway_name'
-            ])
-
-            if colID is None or colAnnotation is None or colGO is None or colKEGG is None:
+            _check_deadline(f"leer {cult}")
+            table = _get_interpretation_table(file_path)
+
+            if table is None:
                 if selected_specific:
                     raise HTTPException(status_code=400, detail=f'El archivo de {cult} no contiene las columnas necesarias (ID, Anotation, GO, KEGG)')
                 continue
+            tables.append((cult, table))
+        t = _stage_done('interp_tables', stage_label, t)
 
-            # Crear filas con el cultivo asociado
-            loaded_cultivos.add(cult)
-            for _, row in df.iterrows():
-                all_rows.append({
-                    'id': str(row[colID]).strip() if pd.notna(row[colID]) else '',
-                    'anotation': str(row[colAnnotation]).strip() if pd.notna(row[colAnnotation]) else '',
-                    'go': str(row[colGO]).strip() if pd.notna(row[colGO]) else '',
-                    'kegg': str(row[colKEGG]).strip() if pd.notna(row[colKEGG]) else '',
-                    'cultivo': cult
-                })
-        
-        # Convertir a DataFrame para facilitar filtrado
-        df2 = pd.DataFrame(all_rows)
-
-        if len(df2) == 0:
+        if sum(table["n"] for _, table in tables) == 0:
             raise HTTPException(status_code=404, detail='No se encontraron archivos compatibles con columnas (ID, Anotation, GO, KEGG)')
         
         # Obtener cultivos disponibles
+        loaded_cultivos = {cult for cult, _ in tables}
         cultivos_disponibles = ['Todos'] + [cult for cult in interpretation_files.keys() if cult in loaded_cultivos]
 
-        # aplicar búsqueda q sobre campo específico
-        if q and len(df2) > 0:
-            ql = str(q).lower()
-            if field not in ['id', 'anotation', 'go', 'kegg', 'cultivo']:
-                field = 'id'
-            df2 = df2[df2[field].str.lower().str.contains(ql, na=False, regex=False)]
+        # aplicar búsqueda q sobre campo específico (consulta al índice de cada tabla)
+        if field not in ['id', 'anotation', 'go', 'kegg', 'cultivo']:
+            field = 'id'
+        ql = str(q).lower() if q else ''
+        matches = []
+        for cult, table in tables:
+            if not ql:
+                idx = np.arange(table["n"])
+            elif field == 'cultivo':
+                idx = np.arange(table["n"]) if ql in cult.lower() else np.zeros(0, dtype=np.int32)
+            else:
+                idx = _search_index(table["search"][field], ql)
+            if len(idx):
+                matches.append((cult, table, idx))
+        t = _stage_done('interp_search', stage_label, t)
+
+        # Paginación: solo se arma la página pedida
+        total = sum(len(idx) for _, _, idx in matches)
+        end = total if limit is None else min(total, offset + limit)
+        page = []
+        pos = 0
+        for cult, table, idx in matches:
+            lo, hi = max(offset - pos, 0), min(end - pos, len(idx))
+            if lo < hi:
+                page.append((cult, table["columns"], idx[lo:hi]))
+            pos += len(idx)
+            if pos >= end:
+                break
 
-        # devolver como lista de dicts
-        rows = df2.to_dict(orient='records') if len(df2) > 0 else []
-        return {
-            'rows': rows,
-            'total': len(rows),
+        if layout == 'columns':
+            data = {'columns': {
+                name: [v for _, cols, sel in page for v in cols[name][sel]]
+                for name in ('id', 'anotation', 'go', 'kegg')
+            }}
+            data['columns']['cultivo'] = [cult for cult, _, sel in page for _ in range(len(sel))]
+        else:
+            data = {'rows': [
+                {
+                    'id': cols['id'][i],
+                    'anotation': cols['anotation'][i],
+                    'go': cols['go'][i],
+                    'kegg': cols['kegg'][i],
+                    'cultivo': cult
+                }
+                for cult, cols, sel in page for i in sel
+            ]}
+        payload = {
+            **data,
+            'total': total,
+            'offset': offset,
+            'limit': limit,
             'cultivos': cultivos_disponibles
         }
+        response = _cached_json_response(request, lambda: payload, etag, last_modified)
+        _stage_done('interp_rows', stage_label, t)
+        return response
 
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f'Error al leer el Excel: {e}')
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f'Error al leer el Excel: {e}')
+
+# --- Perfiles guardados (/admin/profiles) ---
+@app.get("/admin/profiles")
+def list_profiles(request: Request):
+    """Perfiles guardados (del más reciente al más antiguo); requiere X-Admin-Token"""
+    _require_admin(request)
+    profiles = []
+    for path in sorted(PROFILE_DIR.glob("*.meta.json"), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            continue  # borrado por otro worker mientras se listaba
+    return {"ring": PROFILE_RING, "formats": list(PROFILE_FORMATS), "profiles": profiles}
+
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(request: Request, profile_id: str, format: str = "prof"):
+    """Descarga un perfil: prof (pstats, p. ej. para snakeviz), txt (resumen) o torch (traza de Chrome)"""
+    _require_admin(request)
+    if format not in PROFILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format no válido: {format}. Opciones: {list(PROFILE_FORMATS)}")
+    if not re.fullmatch(r"[\w-]+", profile_id):
+        raise HTTPException(status_code=400, detail="id de perfil no válido")
+    path = PROFILE_DIR / f"{profile_id}{PROFILE_FORMATS[format]}"
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail=f"Perfil no encontrado: {profile_id} ({format})")
+    if format == "txt":
+        return PlainTextResponse(path.read_text(encoding="utf-8"))
+    return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+
+# --- /metrics ---
+@app.get("/metrics")
+def metrics():
+    """Métricas en formato de texto de Prometheus"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Métricas desactivadas (ABIO_METRICS=0)")
+    entries = CROPS.entries()
+    lines = REQUEST_LATENCY.render() + REQUESTS_TOTAL.render() + STAGE_LATENCY.render() + CROP_LOAD_LATENCY.render()
+    lines += _prom_gauge(
+        "abio_crop_resident", "1 si el cultivo está cargado en memoria", ("cultivo",),
+        [((p,), int(p in entries)) for p in CROPS.prefixes],
+    )
+    lines += _prom_gauge(
+        "abio_crop_last_load_seconds", "Duración de la última carga del cultivo residente", ("cultivo",),
+        [((p,), crop["load_seconds"]) for p, crop in entries.items()],
+    )
+    lines += _prom_gauge(
+        "abio_crop_artifact_bytes", "Tamaño en disco de los artefactos (o bundle) cargados", ("cultivo", "source"),
+        [((p, crop["source"]), crop["artifact_bytes"]) for p, crop in entries.items()],
+    )
+    lines += _prom_gauge(
+        "abio_crop_weight_bytes", "Pesos del MLP residentes (todas las copias: fp32, fusionada, cuantizada, torch)",
+        ("cultivo", "quantize"),
+        [((p, crop["quantize"] or "fp32"), crop.get("weight_bytes"))
+         for p, crop in entries.items()],
+    )
+    if ADMISSION_ENABLED:
+        gates = [(path, gate.stats()) for path, gate in _ADMISSION_GATES.items()]
+        if _ADMISSION_GLOBAL is not None:
+            gates.append(("*", _ADMISSION_GLOBAL.stats()))
+        lines += _prom_gauge(
+            "abio_admission_total", "Peticiones por resultado del control de admisión", ("endpoint", "outcome"),
+            [((path, outcome), st[outcome]) for path, st in gates for outcome in ADMISSION_OUTCOMES], kind="counter",
+        )
+        lines += _prom_gauge(
+            "abio_admission_in_flight", "Peticiones admitidas en curso", ("endpoint",),
+            [((path,), st["in_flight"]) for path, st in gates],
+        )
+        lines += _prom_gauge(
+            "abio_admission_queue_depth", "Peticiones esperando lugar", ("endpoint",),
+            [((path,), st["queue_depth"]) for path, st in gates],
+        )
+    if PREDICT_CACHE is not None:
+        cache = PREDICT_CACHE.stats()["cultivos"]
+        lines += _prom_gauge(
+            "abio_predict_cache_hits_total", "Aciertos de la caché de predicciones", ("cultivo",),
+            [((p,), st["hits"]) for p, st in cache.items()], kind="counter",
+        )
+        lines += _prom_gauge(
+            "abio_predict_cache_misses_total", "Fallos de la caché de predicciones", ("cultivo",),
+            [((p,), st["misses"]) for p, st in cache.items()], kind="counter",
+        )
+    with _INTERP_LOCK:
+        tables = [(path.stem, entry["table"]) for path, entry in _INTERP_TABLES.items()]
+    lines += _prom_gauge(
+        "abio_interpretation_rows", "Filas de cada tabla de interpretación en memoria", ("tabla",),
+        [((stem,), table["n"]) for stem, table in tables if table is not None],
+    )
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+# ==========================================================
+# Servidor multi-proceso (ver serve.py)
+# ==========================================================
+def prepare_for_fork():
+    """Carga todo el estado de solo lectura antes de crear los workers.
+
+    Los workers lo heredan por copy-on-write: con bundles, pesos y scaler son vistas
+    np.memmap de solo lectura cuyas páginas comparte el kernel, y las tablas de
+    interpretación quedan parseadas una sola vez. gc.freeze() saca esos objetos del
+    recolector para que los hijos no los copien al recorrerlos. El padre no vigila
+    artefactos nuevos: cada worker arranca su propio vigía después del fork.
+    """
+    CROPS.hold_watcher()
+    for prefix in CULTIVOS_DISPONIBLES:
+        try:
+            CROPS.get(prefix)
+        except Exception:
+            pass  # el registro ya registró el error; se reintenta en los workers
+    for path in _interpretation_files().values():
+        _get_interpretation_table(path)
+    _gene_annotation_index()
+    gc.collect()
+    gc.freeze()
+
+def _reset_after_fork():
+    """Recrea en el hijo los locks e hilos del padre; el estado cargado se conserva"""
+    global _MICROBATCHERS_LOCK, _INTERP_LOCK, _BEST_FIT_POOL, _BEST_FIT_LOCK, _CAPTURE_LOCK
+    CROPS._after_fork()
+    _MICROBATCHERS.clear()
+    _MICROBATCHERS_LOCK = threading.Lock()
+    _INTERP_LOCK = threading.Lock()
+    _BEST_FIT_POOL = None
+    _BEST_FIT_LOCK = threading.Lock()
+    _CAPTURE_LOCK = threading.Lock()  # el escritor de captura se recrea al primer uso (otro pid)
+    if torch is not None and TORCH_THREADS > 0:
+        torch.set_num_threads(TORCH_THREADS)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,275 @@
+# ==========================================================
+# bench.py — Benchmarks de las rutas críticas del backend
+# ==========================================================
+# Uso (desde backend/, sin servidor: usa la app en proceso):
+#   python bench.py                                # todo, guarda bench_results/bench_<fecha>.json
+#   python bench.py --only predict,interpretation  # solo algunas secciones
+#   python bench.py --out base.json                # guardar como línea base
+#   python bench.py --compare base.json            # correr y comparar contra la línea base
+#   python bench.py --compare base.json --current bench_results/x.json   # comparar dos archivos
+#
+# Con --compare el proceso termina con código 1 si alguna métrica empeoró más que
+# --threshold (20% por defecto), para poder usarlo en CI.
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BACKEND_DIR / "bench_results"
+SECTIONS = ("cold", "preprocess", "predict", "interpretation")
+TEXTURAS = ["Arenoso", "Franco-arenoso", "Franco", "Franco-arcilloso", "Arcilloso", "Limoso", "Franco-limoso"]
+RANGOS = {
+    "temperatura": (5, 45), "humedadRelativa": (10, 100), "intensidadLuminica": (0, 2000),
+    "pH": (4, 9), "humedadSuelo": (0, 100), "carbonoOrganico": (0, 5), "nitrogenoTotal": (0, 300),
+    "fosforoSoluble": (0, 100), "aguaPorcentual": (0, 40), "nacl": (0, 300), "cd": (0, 5),
+    "al": (0, 3), "zn": (0, 3), "fe": (0, 3),
+}
+
+COLD_START_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import app
+t_import = time.perf_counter() - t0
+loads = {}
+for prefix in app.CULTIVOS_DISPONIBLES:
+    t = time.perf_counter()
+    try:
+        app.CROPS.get(prefix)
+    except Exception:
+        continue
+    loads[prefix] = time.perf_counter() - t
+print("BENCH_JSON " + json.dumps({"import_s": t_import, "loads_s": loads, "total_s": time.perf_counter() - t0}))
+"""
+
+
+def random_sites(n: int, cultivos: list[str], seed: int = 0) -> list[dict]:
+    """Sitios sintéticos distintos entre sí (para no medir aciertos de caché)"""
+    rng = random.Random(seed)
+    sites = []
+    for i in range(n):
+        site = {k: rng.uniform(lo, hi) for k, (lo, hi) in RANGOS.items()}
+        site["cultivo"] = cultivos[i % len(cultivos)]
+        site["texturaSuelo"] = rng.choice(TEXTURAS)
+        sites.append(site)
+    return sites
+
+
+def timed(fn, repeat: int, warmup: int = 3) -> np.ndarray:
+    """Duración en segundos de `repeat` llamadas a fn() (después de `warmup`)"""
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeat)
+    for i in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - t
+    return times
+
+
+def bench_cold_start(runs: int) -> dict:
+    """Importar app.py y cargar cada cultivo en un proceso nuevo (mediana de `runs`)"""
+    env = {**os.environ, "ABIO_PRELOAD_CROPS": "", "ABIO_RELOAD_INTERVAL_S": "0"}
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", COLD_START_SNIPPET], cwd=BACKEND_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        ).stdout
+        line = next(l for l in out.splitlines() if l.startswith("BENCH_JSON "))
+        samples.append(json.loads(line[len("BENCH_JSON "):]))
+
+    metrics = {
+        "cold_start.import_s": float(np.median([s["import_s"] for s in samples])),
+        "cold_start.total_s": float(np.median([s["total_s"] for s in samples])),
+    }
+    for prefix in samples[0]["loads_s"]:
+        metrics[f"cold_start.load_s.{prefix}"] = float(np.median([s["loads_s"][prefix] for s in samples]))
+    return metrics
+
+
+def bench_preprocess_forward(app, repeat: int) -> dict:
+    """preprocess() y forward pass por cultivo, por separado"""
+    metrics = {}
+    for nombre, prefix in app.CULTIVO_MAP.items():
+        try:
+            crop = app.CROPS.get(prefix)
+        except Exception:
+            continue
+        sites = [app.SiteInput(**s) for s in random_sites(256, [nombre], seed=1)]
+        one = sites[0]
+        X_raw = app._raw_features(sites, crop)
+
+        metrics[f"preprocess.{prefix}.single_us"] = float(np.median(timed(lambda: app.preprocess(one, prefix), repeat)) * 1e6)
+        metrics[f"preprocess.{prefix}.batch256_us"] = float(np.median(
+            timed(lambda: app._model_features(app._raw_features(sites, crop), crop), max(1, repeat // 10))
+        ) * 1e6)
+        metrics[f"forward.{prefix}.batch1_us"] = float(np.median(timed(lambda: app._predict_probs_raw(X_raw[:1], crop), repeat)) * 1e6)
+        metrics[f"forward.{prefix}.batch256_us"] = float(np.median(
+            timed(lambda: app._predict_probs_raw(X_raw, crop), max(1, repeat // 10))
+        ) * 1e6)
+    return metrics
+
+
+def bench_predict(client, app, requests: int, concurrency: int) -> dict:
+    """Latencia de POST /predict con `concurrency` clientes simultáneos"""
+    cultivos = []
+    for nombre, prefix in app.CULTIVO_MAP.items():
+        try:
+            app.CROPS.get(prefix)
+            cultivos.append(nombre)
+        except Exception:
+            continue
+    sites = random_sites(requests, cultivos, seed=2)
+    for site in sites[:20]:
+        client.post("/predict", json=site)  # calentamiento
+
+    def call(site):
+        t = time.perf_counter()
+        r = client.post("/predict", json=site)
+        return time.perf_counter() - t, r.status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as ex:
+        results = list(ex.map(call, sites[20:] + sites[:20]))
+    wall = time.perf_counter() - t0
+    lat = np.array([t for t, _ in results]) * 1e3
+    return {
+        "predict.p50_ms": float(np.percentile(lat, 50)),
+        "predict.p90_ms": float(np.percentile(lat, 90)),
+        "predict.p99_ms": float(np.percentile(lat, 99)),
+        "predict.mean_ms": float(lat.mean()),
+        "predict.throughput_rps": len(results) / wall,
+        "predict.errors": sum(1 for _, code in results if code != 200),
+    }
+
+
+def bench_interpretation(client, app, repeat: int) -> dict:
+    """/interpretation/rows para un cultivo y para "Todos", con y sin búsqueda"""
+    files = app._interpretation_files()
+    label, table = next(
+        ((label, t) for label, path in files.items() if (t := app._get_interpretation_table(path)) is not None),
+        (None, None),
+    )
+    if label is None:
+        return {}
+    first_id = next((v for v in table["columns"]["id"] if v), "")
+    q = first_id[:5].lower() or "a"
+
+    cases = {
+        "crop": {"cultivo": label},
+        "crop_q": {"cultivo": label, "q": q},
+        "todos": {"cultivo": "Todos"},
+        "todos_q": {"cultivo": "Todos", "q": q},
+        "todos_page": {"cultivo": "Todos", "limit": 50},
+    }
+    metrics = {}
+    for name, params in cases.items():
+        times = timed(lambda: client.get("/interpretation/rows", params=params), repeat)
+        metrics[f"interpretation.{name}_ms"] = float(np.median(times) * 1e3)
+    return metrics
+
+
+def run(args) -> dict:
+    sections = args.only.split(",") if args.only else list(SECTIONS)
+    metrics: dict[str, float] = {}
+    if "cold" in sections:
+        print("→ arranque en frío...")
+        metrics.update(bench_cold_start(args.cold_runs))
+
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("ABIO_RELOAD_INTERVAL_S", "0")
+    import app
+    from fastapi.testclient import TestClient
+    client = TestClient(app.app)
+
+    if "preprocess" in sections:
+        print("→ preprocess y forward por cultivo...")
+        metrics.update(bench_preprocess_forward(app, args.repeat))
+    if "predict" in sections:
+        print(f"→ /predict con {args.concurrency} clientes...")
+        metrics.update(bench_predict(client, app, args.requests, args.concurrency))
+    if "interpretation" in sections:
+        print("→ /interpretation/rows...")
+        metrics.update(bench_interpretation(client, app, max(5, args.repeat // 20)))
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "env": {k: v for k, v in os.environ.items() if k.startswith("ABIO_")},
+            "args": vars(args),
+        },
+        "metrics": metrics,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list[str]:
+    """Imprime la comparación y devuelve las métricas que empeoraron más que `threshold`"""
+    regressions = []
+    print(f"{'métrica':<42} {'base':>12} {'actual':>12} {'cambio':>8}")
+    for key in sorted(baseline["metrics"]):
+        if key not in current["metrics"]:
+            continue
+        base, cur = baseline["metrics"][key], current["metrics"][key]
+        if base:
+            change = (cur - base) / base
+        else:
+            # Desde 0 (p. ej. predict.errors) cualquier valor positivo es un cambio infinito
+            change = float("inf") if cur > 0 else 0.0
+        # Todo es "menor es mejor" salvo el throughput
+        worse = -change if key.endswith("_rps") else change
+        flag = ""
+        if worse > threshold:
+            regressions.append(key)
+            flag = "  ✗ regresión"
+        print(f"{key:<42} {base:>12.3f} {cur:>12.3f} {change:>+7.0%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del backend AbioStress (en proceso, sin red)")
+    parser.add_argument("--only", help=f"secciones separadas por coma: {','.join(SECTIONS)}")
+    parser.add_argument("--repeat", type=int, default=200, help="repeticiones por micro-benchmark")
+    parser.add_argument("--requests", type=int, default=1000, help="peticiones a /predict")
+    parser.add_argument("--concurrency", type=int, default=8, help="clientes simultáneos en /predict")
+    parser.add_argument("--cold-runs", type=int, default=3, help="procesos para medir el arranque en frío")
+    parser.add_argument("--out", type=Path, help="archivo JSON de resultados")
+    parser.add_argument("--compare", type=Path, help="línea base (JSON) contra la cual comparar")
+    parser.add_argument("--current", type=Path, help="con --compare: resultados ya guardados en lugar de correr")
+    parser.add_argument("--threshold", type=float, default=0.2, help="empeoramiento tolerado (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    if args.current:
+        current = json.loads(args.current.read_text())
+    else:
+        current = run(args)
+        out = args.out or RESULTS_DIR / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(current, indent=2, default=str))
+        print(f"✓ Resultados en {out}")
+        if not args.compare:
+            for key, value in current["metrics"].items():
+                print(f"  {key:<42} {value:>12.3f}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text())
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f"✗ {len(regressions)} métricas empeoraron más de {args.threshold:.0%}")
+            sys.exit(1)
+        print("✓ Sin regresiones")
+
+
+if __name__ == "__main__":
+    main()
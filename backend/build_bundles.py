@@ -0,0 +1,42 @@
+# ==========================================================
+# build_bundles.py — Precompila los artefactos de cada cultivo
+# ==========================================================
+# Uso (desde backend/):
+#   python build_bundles.py              # todos los cultivos
+#   python build_bundles.py tomate maiz  # solo algunos
+#
+# Genera backend/bundles/<prefix>_bundle_<version>.bin, que app.py carga con
+# np.memmap en lugar de joblib/torch.load mientras los artefactos no cambien.
+import argparse
+from pathlib import Path
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompila bundles de cultivos para arranque rápido")
+    parser.add_argument("prefixes", nargs="*", default=app.CULTIVOS_DISPONIBLES,
+                        help="prefijos a empaquetar (por defecto todos)")
+    parser.add_argument("--out", type=Path, default=app.BUNDLES_DIR, help="carpeta de salida")
+    args = parser.parse_args()
+
+    ok = 0
+    for prefix in args.prefixes:
+        try:
+            crop = app._load_crop(prefix, use_bundle=False)
+            path = app.write_crop_bundle(crop, args.out)
+        except Exception as e:
+            print(f"✗ {prefix}: {e}")
+            continue
+        # Los bundles anteriores del mismo cultivo ya no se usan
+        for old in args.out.glob(f"{prefix}_bundle_*.bin"):
+            if old != path:
+                old.unlink()
+        ok += 1
+        print(f"✓ {prefix}: {path.name} ({path.stat().st_size / 1024:.0f} KB)")
+
+    print(f"{ok}/{len(args.prefixes)} bundles generados en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# ==========================================================
+# convert_tables.py — Convierte las tablas de interpretación
+# ==========================================================
+# Uso (desde backend/):
+#   python convert_tables.py                               # todos los workbooks de db/
+#   python convert_tables.py ../db/genes_maiz_final.xlsx   # solo algunos
+#
+# Genera backend/tables/<nombre>_<hash>.tbl con las columnas id/anotation/go/kegg
+# ya resueltas (normalize_col_name/find_col). app.py lee esos archivos con np.memmap
+# mientras sean más nuevos que el workbook; si no, vuelve a leer el Excel.
+import argparse
+from pathlib import Path
+
+import app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte las tablas de interpretación a formato columnar")
+    parser.add_argument("files", nargs="*", type=Path,
+                        help="workbooks a convertir (por defecto los que usa /interpretation/rows)")
+    parser.add_argument("--out", type=Path, default=app.TABLES_DIR, help="carpeta de salida")
+    args = parser.parse_args()
+
+    files = args.files or list(app._interpretation_files().values())
+    ok = 0
+    for source in files:
+        try:
+            path, n = app.write_converted_table(source, args.out)
+        except Exception as e:
+            print(f"✗ {source.name}: {e}")
+            continue
+        ok += 1
+        if n is None:
+            print(f"⚠️ {source.name}: faltan columnas id/anotation/go/kegg (se marca como no interpretable)")
+        else:
+            print(f"✓ {source.name}: {path.name} ({n} filas, {path.stat().st_size / 1024:.0f} KB)")
+
+    print(f"{ok}/{len(files)} tablas convertidas en {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# ==========================================================
+# replay.py — Reproduce tráfico capturado con ABIO_CAPTURE_RATE
+# ==========================================================
+# Uso (desde backend/):
+#   python replay.py logs/capture/capture_*.ndjson*               # en proceso, a velocidad original
+#   python replay.py captura.ndjson --speed 10                    # 10x más rápido (0 = sin esperas)
+#   python replay.py captura.ndjson --url http://localhost:8000   # contra un servidor
+#   python replay.py captura.ndjson --candidate staging/          # diferencias con artefactos candidatos
+#   python replay.py captura.ndjson --url http://a:8000 --compare-url http://b:8000
+#
+# Reporta throughput y percentiles de latencia por ruta (junto a los capturados) y, con
+# --candidate o --compare-url, las predicciones de /predict que cambian entre las dos
+# versiones. Con --fail-on-diff termina con código 1 si alguna línea predicha cambia.
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent
+MAX_EXAMPLES = 10
+
+
+def load_records(files: list[Path], paths: set[str], limit: int = 0) -> list[dict]:
+    """Lee los NDJSON (incluidos los rotados), descarta líneas rotas y ordena por ts.
+
+    Se omiten los POST sin cuerpo JSON guardado (no JSON, muy grande o sin cuerpo, p. ej.
+    un 403 del perfilado): reenviarlos daría un 422 que no tiene que ver con el original.
+    """
+    records, broken, bodyless = [], 0, 0
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    broken += 1
+                    continue
+                if record.get("path") not in paths:
+                    continue
+                if record.get("method") == "POST" and record.get("body") is None:
+                    bodyless += 1
+                    continue
+                records.append(record)
+    if broken:
+        print(f"⚠️ {broken} líneas ilegibles ignoradas")
+    if bodyless:
+        print(f"⚠️ {bodyless} POST sin cuerpo guardado omitidos")
+    records.sort(key=lambda r: r["ts"])
+    return records[:limit] if limit else records
+
+
+def _url(record: dict) -> str:
+    return record["path"] + (f"?{record['query']}" if record.get("query") else "")
+
+
+def _send(client, record: dict):
+    if record["method"] == "POST":
+        return client.post(_url(record), json=record.get("body"))
+    return client.get(_url(record))
+
+
+def replay(records: list[dict], client, speed: float, concurrency: int) -> tuple[list[dict], float]:
+    """Envía los registros respetando sus intervalos (divididos por speed) y mide cada respuesta"""
+    t_start = time.perf_counter()
+    ts0 = records[0]["ts"]
+
+    def call(record, due):
+        started = time.perf_counter()
+        try:
+            r = _send(client, record)
+            status = r.status_code
+        except Exception as e:
+            status = f"error: {type(e).__name__}"
+        return {
+            "path": record["path"],
+            "status": status,
+            "latency_ms": (time.perf_counter() - started) * 1e3,
+            "lag_ms": max(0.0, started - due) * 1e3,  # cuánto se atrasó respecto del horario original
+        }
+
+    futures = []
+    with ThreadPoolExecutor(concurrency) as ex:
+        for record in records:
+            due = t_start + (record["ts"] - ts0) / speed if speed > 0 else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(ex.submit(call, record, due))
+    results = [f.result() for f in futures]
+    return results, time.perf_counter() - t_start
+
+
+def summarize(records: list[dict], results: list[dict], wall: float) -> dict:
+    """Throughput, códigos y percentiles por ruta, junto a las latencias capturadas"""
+    by_path = defaultdict(list)
+    for record, result in zip(records, results):
+        by_path[record["path"]].append((record, result))
+
+    def pct(values):
+        v = np.asarray(values, dtype=float)
+        return {"p50_ms": float(np.percentile(v, 50)), "p90_ms": float(np.percentile(v, 90)),
+                "p99_ms": float(np.percentile(v, 99)), "max_ms": float(v.max())}
+
+    paths = {}
+    for path, pairs in by_path.items():
+        paths[path] = {
+            "n": len(pairs),
+            "status": dict(Counter(str(res["status"]) for _, res in pairs)),
+            "replay": pct([res["latency_ms"] for _, res in pairs]),
+            "captured": pct([rec["duration_ms"] for rec, _ in pairs]),
+        }
+    return {
+        "requests": len(results),
+        "wall_s": wall,
+        "throughput_rps": len(results) / wall if wall else 0.0,
+        "lag_p99_ms": float(np.percentile([r["lag_ms"] for r in results], 99)),
+        "paths": paths,
+    }
+
+
+def _diffable(record: dict) -> bool:
+    """/predict respondido con 200 y sin MC dropout (que es aleatorio salvo con mc_seed)"""
+    query = parse_qs(record.get("query", ""))
+    return (record["path"] == "/predict" and record.get("status") == 200
+            and isinstance(record.get("body"), dict) and "mc_samples" not in query)
+
+
+def candidate_pairs(app, records: list[dict], candidate_dir: Path) -> list[tuple]:
+    """Probabilidades de la versión actual y de la candidata (artefactos de candidate_dir), por sitio"""
+    by_prefix = defaultdict(list)
+    for i, record in enumerate(records):
+        if _diffable(record):
+            by_prefix[app.CULTIVO_MAP.get(record["body"].get("cultivo"))].append(i)
+
+    pairs = []
+    for prefix, idx in by_prefix.items():
+        if prefix is None:
+            continue
+        try:
+            current = app.CROPS.get(prefix)
+            paths = app._artifact_paths(prefix, override_dir=candidate_dir)
+            if paths == app._artifact_paths(prefix):
+                print(f"· {prefix}: sin artefactos candidatos, se omite")
+                continue
+            candidate = app._load_crop(prefix, paths=paths, use_bundle=False)
+        except Exception as e:
+            print(f"✗ {prefix}: {e}")
+            continue
+        print(f"→ {prefix}: {current['version']} → {candidate['version']} ({len(idx)} sitios)")
+        sites = [app.SiteInput(**records[i]["body"]) for i in idx]
+        probs_a = app._predict_probs_raw(app._raw_features(sites, current), current)
+        probs_b = app._predict_probs_raw(app._raw_features(sites, candidate), candidate)
+        for k, i in enumerate(idx):
+            pairs.append((
+                i, prefix,
+                dict(zip(current["class_names"], map(float, probs_a[k]))),
+                dict(zip(candidate["class_names"], map(float, probs_b[k]))),
+            ))
+    return pairs
+
+
+def url_pairs(client_a, client_b, records: list[dict]) -> list[tuple]:
+    """Probabilidades que devuelven dos servidores para los mismos /predict"""
+    pairs = []
+    for i, record in enumerate(records):
+        if not _diffable(record):
+            continue
+        ra, rb = _send(client_a, record), _send(client_b, record)
+        if ra.status_code != 200 or rb.status_code != 200:
+            pairs.append((i, record["body"].get("cultivo"), {"status": ra.status_code}, {"status": rb.status_code}))
+            continue
+        pairs.append((i, record["body"].get("cultivo"), ra.json()["probabilities"], rb.json()["probabilities"]))
+    return pairs
+
+
+def diff_predictions(pairs: list[tuple], tolerance: float) -> dict:
+    """Cambios de línea predicha y de probabilidad entre dos versiones"""
+    changed, drifted, max_diff, examples = 0, 0, 0.0, []
+    per_cultivo = defaultdict(lambda: {"n": 0, "line_changed": 0})
+    for i, cultivo, a, b in pairs:
+        per_cultivo[cultivo]["n"] += 1
+        if "status" in a or "status" in b:  # alguna versión respondió con error
+            changed += 1
+            per_cultivo[cultivo]["line_changed"] += 1
+            if len(examples) < MAX_EXAMPLES:
+                examples.append({"record": i, "cultivo": cultivo, "a": a, "b": b})
+            continue
+        lines = set(a) | set(b)
+        diff = max(abs(a.get(l, 0.0) - b.get(l, 0.0)) for l in lines)
+        max_diff = max(max_diff, diff)
+        line_a, line_b = max(a, key=a.get), max(b, key=b.get)
+        if diff > tolerance:
+            drifted += 1
+        if line_a != line_b:
+            changed += 1
+            per_cultivo[cultivo]["line_changed"] += 1
+            if len(examples) < MAX_EXAMPLES:
+                examples.append({"record": i, "cultivo": cultivo, "line_a": line_a, "line_b": line_b,
+                                 "p_a": a[line_a], "p_b": b.get(line_a, 0.0), "max_abs_diff": diff})
+    return {
+        "compared": len(pairs),
+        "line_changed": changed,
+        "prob_over_tolerance": drifted,
+        "tolerance": tolerance,
+        "max_abs_prob_diff": max_diff,
+        "per_cultivo": dict(per_cultivo),
+        "examples": examples,
+    }
+
+
+def print_report(report: dict):
+    rep = report["replay"]
+    print(f"{rep['requests']} peticiones en {rep['wall_s']:.1f} s ({rep['throughput_rps']:.1f} req/s), "
+          f"atraso p99 {rep['lag_p99_ms']:.1f} ms")
+    print(f"{'ruta':<22} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}   {'capturado p50/p99':>18}  códigos")
+    for path, s in rep["paths"].items():
+        r, c = s["replay"], s["captured"]
+        print(f"{path:<22} {s['n']:>6} {r['p50_ms']:>8.1f} {r['p90_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}"
+              f"   {c['p50_ms']:>8.1f}/{c['p99_ms']:<8.1f}  {s['status']}")
+    diff = report.get("diff")
+    if diff:
+        print(f"Predicciones comparadas: {diff['compared']}, línea distinta: {diff['line_changed']}, "
+              f"probabilidad > {diff['tolerance']}: {diff['prob_over_tolerance']}, "
+              f"máx. |Δp| {diff['max_abs_prob_diff']:.4f}")
+        for ex in diff["examples"]:
+            print(f"  #{ex['record']} {ex['cultivo']}: {ex.get('line_a', ex.get('a'))} → {ex.get('line_b', ex.get('b'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce tráfico capturado y compara versiones de modelos")
+    parser.add_argument("files", nargs="+", type=Path, help="archivos NDJSON de logs/capture/")
+    parser.add_argument("--url", help="servidor a usar (por defecto la app en proceso)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = velocidad original, 10 = 10x, 0 = sin esperas")
+    parser.add_argument("--concurrency", type=int, default=16, help="peticiones simultáneas como máximo")
+    parser.add_argument("--paths", default="/predict,/interpretation/rows", help="rutas a reproducir")
+    parser.add_argument("--limit", type=int, default=0, help="solo las primeras N peticiones")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="peticiones distintas (ruta, cultivo, query) sin medir antes de empezar, para cargar modelos y tablas")
+    parser.add_argument("--candidate", type=Path, help="carpeta con artefactos candidatos (en proceso)")
+    parser.add_argument("--compare-url", help="segundo servidor contra el cual comparar predicciones")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="diferencia de probabilidad tolerada")
+    parser.add_argument("--out", type=Path, help="archivo JSON con el reporte")
+    parser.add_argument("--fail-on-diff", action="store_true", help="código 1 si cambia alguna línea predicha")
+    args = parser.parse_args()
+
+    records = load_records(args.files, set(args.paths.split(",")), args.limit)
+    if not records:
+        sys.exit("No hay peticiones para reproducir")
+    if args.candidate and args.url:
+        sys.exit("--candidate compara en proceso; no se combina con --url")
+
+    app = None
+    if args.url:
+        import httpx
+        client = httpx.Client(base_url=args.url, timeout=60)
+    else:
+        sys.path.insert(0, str(BACKEND_DIR))
+        os.environ["ABIO_CAPTURE_RATE"] = "0"  # no volver a capturar lo que se reproduce
+        os.environ.setdefault("ABIO_RELOAD_INTERVAL_S", "0")
+        import app
+        from fastapi.testclient import TestClient
+        client = TestClient(app.app)
+
+    if args.warmup:
+        seen = {}
+        for record in records:
+            key = (record["path"], (record.get("body") or {}).get("cultivo"), record.get("query"))
+            seen.setdefault(key, record)
+        for record in list(seen.values())[:args.warmup]:
+            _send(client, record)
+
+    span = records[-1]["ts"] - records[0]["ts"]
+    print(f"→ {len(records)} peticiones ({span:.0f} s capturados) contra {args.url or 'la app en proceso'}, "
+          f"velocidad {args.speed or 'máxima'}")
+    results, wall = replay(records, client, args.speed, args.concurrency)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "files": [str(f) for f in args.files],
+            "env": {k: v for k, v in os.environ.items() if k.startswith("ABIO_")},
+            "args": vars(args),
+        },
+        "replay": summarize(records, results, wall),
+    }
+
+    if args.candidate:
+        report["diff"] = diff_predictions(candidate_pairs(app, records, args.candidate), args.tolerance)
+    elif args.compare_url:
+        import httpx
+        report["diff"] = diff_predictions(
+            url_pairs(client, httpx.Client(base_url=args.compare_url, timeout=60), records), args.tolerance
+        )
+
+    print_report(report)
+    if args.out:
+        args.out.parent.mkdir(parents=True, exist_ok=True)
+        args.out.write_text(json.dumps(report, indent=2, default=str, ensure_ascii=False))
+        print(f"✓ Reporte en {args.out}")
+    if args.fail_on_diff and report.get("diff", {}).get("line_changed"):
+        print("✗ Hay predicciones distintas entre versiones")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
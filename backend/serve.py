@@ -0,0 +1,96 @@
+# ==========================================================
+# serve.py — Backend en varios procesos con estado compartido
+# ==========================================================
+# Uso (desde backend/, solo Linux/macOS):
+#   python serve.py                       # un worker por núcleo, 1 hilo de torch cada uno
+#   python serve.py --workers 4 --threads 2 --port 8000
+#
+# A diferencia de `uvicorn --workers N` (que arranca cada worker desde cero), aquí el
+# proceso padre importa app.py, carga todos los cultivos y tablas y recién después hace
+# fork: los workers comparten ese estado en lugar de tener una copia cada uno.
+# Ver docs/README_deploy.md para dimensionar workers e hilos.
+import argparse
+import os
+import signal
+import socket
+import sys
+
+
+def _default_workers(threads: int) -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return max(1, cores // max(1, threads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sirve app.py con varios workers que comparten modelos y tablas")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("ABIO_TORCH_THREADS") or 1),
+                        help="hilos de torch/BLAS por worker (por defecto 1)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="número de procesos (por defecto núcleos disponibles / threads)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        sys.exit("serve.py necesita fork(); en Windows usar `uvicorn app:app`")
+    workers = args.workers or _default_workers(args.threads)
+
+    # Antes de importar numpy/torch: cada worker usa `threads` hilos y no todos los núcleos
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(args.threads)
+    os.environ["ABIO_TORCH_THREADS"] = str(args.threads)
+
+    import uvicorn
+    import app
+
+    print(f"Cargando estado compartido antes de crear {workers} workers...")
+    app.prepare_for_fork()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    def spawn() -> int:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            config = uvicorn.Config(app.app, log_level=args.log_level)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+        return pid
+
+    children = {spawn() for _ in range(workers)}
+    print(f"✓ {workers} workers × {args.threads} hilos escuchando en http://{args.host}:{args.port}")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        # Un worker que muere sin que se pida parar se reemplaza
+        if not stopping:
+            print(f"⚠️ Worker {pid} terminó (status {status}); creando otro")
+            children.add(spawn())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Pruebas del backend (desde backend/: python -m pytest -q tests)
+# Usan los artefactos reales de models/ y preproc/, en proceso y sin red.
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+os.environ.setdefault("ABIO_RELOAD_INTERVAL_S", "0")
+os.environ.setdefault("ABIO_PRELOAD_CROPS", "")
+os.environ["ABIO_CAPTURE_RATE"] = "0"
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import app
+    return app
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+    return TestClient(app_module.app)
+
+
+@pytest.fixture
+def site():
+    return {
+        "cultivo": "Tomate", "temperatura": 28.0, "humedadRelativa": 60.0, "intensidadLuminica": 900.0,
+        "pH": 6.8, "humedadSuelo": 35.0, "carbonoOrganico": 1.2, "nitrogenoTotal": 40.0,
+        "fosforoSoluble": 20.0, "aguaPorcentual": 18.0, "nacl": 50.0, "cd": 0.2, "al": 0.1,
+        "zn": 0.3, "fe": 0.4, "texturaSuelo": "Franco",
+    }
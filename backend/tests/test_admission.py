@@ -0,0 +1,56 @@
+import asyncio
+
+
+def _run_concurrently(app_module, path, n, hold_s=0.05):
+    """n peticiones simultáneas a `path` a través de _AdmissionMiddleware; devuelve sus códigos"""
+    async def inner(scope, receive, send):
+        await asyncio.sleep(hold_s)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    middleware = app_module._AdmissionMiddleware(inner)
+
+    async def one():
+        status = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        scope = {"type": "http", "path": path, "method": "POST", "headers": [], "query_string": b""}
+        await middleware(scope, receive, send)
+        return status[0]
+
+    async def main():
+        return await asyncio.gather(*(one() for _ in range(n)))
+
+    return asyncio.run(main())
+
+
+def test_queue_zero_means_unbounded(app_module, monkeypatch):
+    gate = app_module._AdmissionGate(1, 0)
+    monkeypatch.setitem(app_module._ADMISSION_GATES, "/predict/batch", gate)
+    monkeypatch.setattr(app_module, "_ADMISSION_GLOBAL", None)
+    monkeypatch.setitem(app_module.ADMISSION_LIMITS, "/predict/batch", {"concurrency": 1, "queue": 0, "deadline_ms": 0})
+
+    statuses = _run_concurrently(app_module, "/predict/batch", 12, hold_s=0.005)
+    assert statuses == [200] * 12
+    assert gate.counts["admitted"] == 1 and gate.counts["queued"] == 11 and gate.counts["rejected"] == 0
+
+
+def test_global_rejection_counted_on_endpoint(app_module, monkeypatch):
+    endpoint = app_module._AdmissionGate(8, 32)
+    global_gate = app_module._AdmissionGate(1, 1)
+    monkeypatch.setitem(app_module._ADMISSION_GATES, "/predict/batch", endpoint)
+    monkeypatch.setattr(app_module, "_ADMISSION_GLOBAL", global_gate)
+    monkeypatch.setitem(app_module.ADMISSION_LIMITS, "/predict/batch", {"concurrency": 8, "queue": 32, "deadline_ms": 0})
+
+    statuses = _run_concurrently(app_module, "/predict/batch", 12)
+    ok = statuses.count(200)
+    rejected = statuses.count(503)
+    assert rejected > 0 and ok + rejected == 12
+    assert endpoint.counts["rejected"] == global_gate.counts["rejected"] == rejected
+    assert endpoint.counts["admitted"] + endpoint.counts["queued"] == ok
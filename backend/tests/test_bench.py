@@ -0,0 +1,17 @@
+import bench
+
+
+def _results(**metrics):
+    return {"metrics": metrics}
+
+
+def test_compare_flags_errors_rising_from_zero():
+    base = _results(**{"predict.errors": 0, "predict.p50_ms": 5.0})
+    cur = _results(**{"predict.errors": 500, "predict.p50_ms": 5.0})
+    assert bench.compare(base, cur, 0.2) == ["predict.errors"]
+
+
+def test_compare_zero_baseline_unchanged_or_better():
+    base = _results(**{"predict.errors": 0, "predict.throughput_rps": 0.0})
+    cur = _results(**{"predict.errors": 0, "predict.throughput_rps": 100.0})
+    assert bench.compare(base, cur, 0.2) == []
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+
+def test_resident_weight_bytes_counts_quantized_copy(app_module):
+    crop = app_module.CROPS.get("tomate")
+    layers = crop["run_layers"]
+    fp32 = app_module._resident_weight_bytes(layers)
+    assert fp32 == app_module._weight_bytes(layers)
+    assert app_module._resident_weight_bytes(layers, list(layers)) == fp32  # mismos buffers: una vez
+
+    engine = app_module._build_engine("numpy", layers, crop, layers[0][0].shape[1], quantize="int8")
+    total = app_module._resident_weight_bytes(layers, engine.weights)
+    # Pesos int8 + una escala por neurona; los bias son los mismos arreglos fp32
+    assert total == fp32 + sum(W.size + W.shape[0] * 4 for W, _ in layers)
+    X = np.zeros((2, layers[0][0].shape[1]), dtype=np.float32)
+    assert engine(X).shape == (2, len(crop["class_names"]))
+
+
+def test_fused_engine_matches_sklearn_preprocessing(app_module):
+    crop = app_module._load_crop("tomate", use_bundle=False)
+    assert crop["fused"] and crop["fuse_check"]["reference"] == "sklearn"
+
+    X_raw = app_module._calibration_rows(crop, 512, seed=7)
+    expected = app_module._numpy_engine(crop["layers"])(app_module._sklearn_features(X_raw, crop))
+    np.testing.assert_allclose(crop["engine"](X_raw), expected, atol=1e-4)
+
+
+def test_wrong_affine_extraction_rejected_at_load(app_module):
+    crop = dict(app_module._load_crop("tomate", use_bundle=False))
+    mean, scale = crop["scaler_affine"]
+    crop["scaler_affine"] = (mean, scale * 1.5)  # extracción errónea del scaler
+    # Contra sklearn ni la fusión ni el camino sin fusionar coinciden: el cultivo no carga
+    with pytest.raises(RuntimeError, match="diferencia"):
+        app_module._attach_engine(crop)
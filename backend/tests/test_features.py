@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler, RobustScaler, StandardScaler
+
+
+def _fit(scaler, crop, seed=0):
+    X = np.random.default_rng(seed).normal(5.0, 3.0, (64, len(crop["num_cols"])))
+    return scaler.fit(pd.DataFrame(X, columns=crop["num_cols"]))
+
+
+def test_scaler_affine_only_for_standard_scaler(app_module):
+    crop = app_module._load_crop("tomate", use_bundle=False)
+    assert app_module._scaler_affine(_fit(MinMaxScaler(), crop)) is None
+    assert app_module._scaler_affine(_fit(RobustScaler(), crop)) is None
+
+    mean, scale = app_module._scaler_affine(_fit(StandardScaler(with_mean=False), crop))
+    assert not mean.any() and scale.any()
+    mean, scale = app_module._scaler_affine(_fit(StandardScaler(with_std=False), crop))
+    assert mean.any() and (scale == 1).all()
+
+
+def test_non_affine_scaler_uses_sklearn_transform(app_module):
+    crop = dict(app_module._load_crop("tomate", use_bundle=False))
+    crop["scaler"] = _fit(MinMaxScaler(), crop)
+    crop["scaler_affine"] = app_module._scaler_affine(crop["scaler"])
+
+    X_raw = app_module._calibration_rows(crop, 32)
+    X = app_module._model_features(X_raw, crop)
+    expected = crop["scaler"].transform(pd.DataFrame(X_raw, columns=crop["num_cols"]))
+    k = min(expected.shape[1], X.shape[1])
+    np.testing.assert_allclose(X[:, :k], expected[:, :k], rtol=1e-5, atol=1e-5)
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="necesita fork()")
+def test_worker_starts_its_own_watcher(app_module, monkeypatch):
+    crops = app_module.CROPS
+    monkeypatch.setattr(crops, "reload_interval_s", 3600)
+    monkeypatch.setattr(crops, "_watcher_held", False)
+    monkeypatch.setattr(crops, "_watcher", None)
+
+    # Como prepare_for_fork(): el padre carga cultivos pero no vigila
+    crops.hold_watcher()
+    crops.get("tomate")
+    assert crops._watcher is None
+
+    pid = os.fork()
+    if pid == 0:  # hijo: mismo estado que un worker de serve.py
+        crops.get("tomate")
+        watcher = crops._watcher
+        os._exit(0 if watcher is not None and watcher.is_alive() else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
@@ -0,0 +1,5 @@
+def test_unknown_interpretation_cultivo_not_used_as_label(client):
+    assert client.get("/interpretation/rows", params={"cultivo": "bogus0", "limit": 1}).status_code == 404
+    text = client.get("/metrics").text
+    assert "bogus0" not in text
+    assert 'cultivo="otro"' in text
@@ -0,0 +1,39 @@
+import os
+import shutil
+
+import numpy as np
+
+
+def _cache_key_after(app_module, site, paths_a, paths_b):
+    crop_a = app_module._load_crop("tomate", paths=paths_a, use_bundle=False)
+    crop_b = app_module._load_crop("tomate", paths=paths_b, use_bundle=False)
+    x = app_module._raw_features([app_module.SiteInput(**site)], crop_a)[0]
+    cache = app_module._PredictionCache(16, None)
+    cache.put(cache.key(crop_a, x), np.array([1.0]))
+    return crop_a, crop_b, cache.get_many("tomate", [cache.key(crop_b, x)])[0]
+
+
+def test_scaler_only_swap_misses_cache(app_module, site, tmp_path):
+    paths = app_module._artifact_paths("tomate")
+    # Mismo checkpoint, scaler nuevo (nombre con timestamp más reciente)
+    shutil.copy(paths["scaler"], tmp_path / "tomate_scaler_29991231_000000.joblib")
+    swapped = app_module._artifact_paths("tomate", override_dir=tmp_path)
+    assert swapped["model"] == paths["model"] and swapped["scaler"] != paths["scaler"]
+
+    crop_a, crop_b, cached = _cache_key_after(app_module, site, paths, swapped)
+    assert crop_a["version"] != crop_b["version"]
+    assert cached is None
+
+
+def test_rewritten_artifact_with_same_name_misses_cache(app_module, site, tmp_path):
+    paths = app_module._artifact_paths("tomate")
+    copy = tmp_path / paths["meta"].name
+    shutil.copy(paths["meta"], copy)
+    first = {**paths, "meta": copy}
+    before = app_module._artifacts_version(first)
+    st = copy.stat()
+    os.utime(copy, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert app_module._artifacts_version(first) != before
+
+    _, _, cached = _cache_key_after(app_module, site, paths, first)
+    assert cached is None
@@ -0,0 +1,25 @@
+def _sweep(client, site, *steps):
+    params = ["temperatura", "nacl"]
+    axes = [{"param": params[i], "start": 0, "stop": 40, "steps": s} for i, s in enumerate(steps)]
+    return client.post("/predict/sweep", json={"site": site, "axes": axes})
+
+
+def test_sweep_grid_shape(client, site):
+    r = _sweep(client, site, 3, 4)
+    assert r.status_code == 200
+    result = r.json()["cultivos"]["Tomate"]
+    assert len(result["winner"]) == 3 and len(result["winner"][0]) == 4
+
+
+def test_sweep_steps_overflow_rejected(client, site):
+    # 2**32 x 2**32 desborda int64 a 0 celdas; debe rechazarse antes de armar la grilla
+    assert _sweep(client, site, 2**32, 2**32).status_code == 422
+
+
+def test_sweep_steps_over_cap_rejected(client, site, app_module):
+    assert _sweep(client, site, app_module.MAX_SWEEP_CELLS + 1).status_code == 422
+    assert _sweep(client, site, 0).status_code == 422
+
+
+def test_sweep_product_over_cap_rejected(client, site, app_module):
+    assert _sweep(client, site, 300, 300).status_code == 413
@@ -12,32 +12,34 @@ GREEN='\033[0;32m'
 YELLOW='\033[1;33m'
 NC='\033[0m' # No Color
 
-echo -e "${YELLOW}1️  Verificando archivos de Sandía...${NC}"
-if [ -f "backend/models/red3_site_meta_20251018_151143.json" ] && \
-   [ -f "backend/models/red3_site_student_20251018_151143.pt" ] && \
-   [ -f "backend/models/red3_line_gene_panel.json" ]; then
-    echo -e "${GREEN}    Archivos de Sandía presentes${NC}"
-else
-    echo -e "${RED}    Faltan archivos de Sandía${NC}"
-fi
+echo -e "${YELLOW}1️  Verificando modelos por cultivo...${NC}"
+for prefix in sandia maiz tomate gh sorgo; do
+    if ls backend/models/${prefix}_site_meta_*.json >/dev/null 2>&1 && \
+       ls backend/models/${prefix}_site_student_*.pt >/dev/null 2>&1 && \
+       [ -f "backend/models/${prefix}_line_gene_panel.json" ]; then
+        echo -e "${GREEN}    Archivos de ${prefix} presentes${NC}"
+    else
+        echo -e "${RED}    Faltan archivos de ${prefix}${NC}"
+    fi
+done
 
 echo ""
-echo -e "${YELLOW}2️  Verificando archivos de Maíz...${NC}"
-if [ -f "backend/models/maiz_site_meta_20251111_132606.json" ] && \
-   [ -f "backend/models/maiz_site_student_20251111_132606.pt" ] && \
-   [ -f "backend/models/maiz_line_gene_panel.json" ]; then
-    echo -e "${GREEN}    Archivos de Maíz presentes${NC}"
-else
-    echo -e "${RED}    Faltan archivos de Maíz${NC}"
-fi
+echo -e "${YELLOW}2️  Verificando archivos de preprocesamiento...${NC}"
+for prefix in sandia maiz tomate gh sorgo; do
+    if ls backend/preproc/${prefix}_scaler_*.joblib >/dev/null 2>&1 && \
+       ls backend/preproc/${prefix}_columns_*.json >/dev/null 2>&1; then
+        echo -e "${GREEN}    Preproc de ${prefix} presente${NC}"
+    else
+        echo -e "${RED}    Falta preproc de ${prefix}${NC}"
+    fi
+done
 
 echo ""
-echo -e "${YELLOW}3️  Verificando archivos de preprocesamiento...${NC}"
-if [ -f "backend/preproc/red3_scaler_20251018_145912.joblib" ] && \
-   [ -f "backend/preproc/maiz_scaler_20251111_131028.joblib" ]; then
-    echo -e "${GREEN}    Escalers cargados${NC}"
+echo -e "${YELLOW}3️  Verificando bundles precompilados...${NC}"
+if ls backend/bundles/*_bundle_*.bin >/dev/null 2>&1; then
+    echo -e "${GREEN}    Bundles presentes (python build_bundles.py para regenerarlos)${NC}"
 else
-    echo -e "${RED}    Faltan escalers${NC}"
+    echo -e "${YELLOW}    Sin bundles: el backend usará los artefactos originales${NC}"
 fi
 
 echo ""
@@ -60,8 +62,15 @@ echo ""
 echo -e "${YELLOW}6️  Cargando backend...${NC}"
 cd backend && python3 -c "
 import app
-print('    Cultivos:', list(app.CULTIVOS_CONFIG.keys()))
-print('    Modelos:', list(app.MODELOS.keys()))
+cargados = []
+for p in app.CROPS.prefixes:
+    try:
+        app.CROPS.get(p)
+        cargados.append(p)
+    except Exception:
+        pass
+print('    Cultivos:', app.CROPS.prefixes)
+print('    Modelos:', cargados)
 " 2>&1 | grep "Cultivos: \|Modelos:" && echo -e "${GREEN}    Backend cargado correctamente${NC}" || echo -e "${RED}    Error al cargar el backend${NC}"
 
 echo ""
@@ -73,6 +82,7 @@ echo -e "Para probar el backend:"
 echo -e "  ${YELLOW}cd backend${NC}"
 echo -e "  ${YELLOW}pip install fastapi uvicorn pytorch pandas scikit-learn${NC}"
 echo -e "  ${YELLOW}uvicorn app:app --reload${NC}"
+echo -e "  ${YELLOW}python bench.py${NC}   # benchmarks (ver docs/README_benchmarks.md)"
 echo ""
 echo -e "Para probar el frontend:"
 echo -e "  ${YELLOW}cd quasar-project${NC}"